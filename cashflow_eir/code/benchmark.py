@@ -0,0 +1,233 @@
+"""
+Benchmark
+
+Developers:
+James Briggs
+
+Description:
+Script used to time and memory profile each stage of the cashflow model on
+loanbooks generated by 'data.make_loans', from thousands to millions of
+loans. Results are saved as JSON so runs of different versions can be
+compared with 'compare'.
+
+Run from the code directory with:
+    python benchmark.py 1000 10000 100000 1000000
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import data as d
+import model as mo
+
+
+# stages timed for every volume, in the order they run
+STAGES = ['calc_loanbook', 'Cashflow.__init__', 'calculate_cashflow',
+          'calculate_vals', 'output']
+
+
+def measure(func, *args, memory=True, **kwargs):
+    """
+    Runs a function, measuring its wall and CPU time and the peak memory
+    allocated while it runs. Tracing allocations slows Python code down
+    several times, so where memory is measured the function is run a second
+    time under tracemalloc rather than tracing the timed run.
+
+    Parameters
+    ----------
+    func : function
+        Function to run, it must give the same result when run twice.
+    *args, **kwargs
+        Arguments passed to func.
+    memory : Boolean, optional
+        True/False value defining whether to measure peak memory.
+        The default is True.
+
+    Returns
+    -------
+    result
+        Value returned by the timed run of func.
+    stats : dictionary
+        Dictionary of {'wall': seconds, 'cpu': seconds, 'peak_bytes': int},
+        peak_bytes is None if memory is not measured.
+    """
+    wall, cpu = time.perf_counter(), time.process_time()
+    result = func(*args, **kwargs)
+    stats = {'wall': time.perf_counter() - wall,
+             'cpu': time.process_time() - cpu,
+             'peak_bytes': None}
+
+    if memory:
+        tracemalloc.start()
+        func(*args, **kwargs)
+        stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, stats
+
+
+def run_benchmark(volumes=(1000, 10000, 100000, 1000000), products=6,
+                  horizon=120, seed=0, engine='numpy', out=['cashflow'],
+                  output_format='csv', memory=True,
+                  path="./Outputs/Benchmark", label=None, verbose=True):
+    """
+    Times and memory profiles each model stage for loanbooks of each volume,
+    saving the results to '{path}/benchmark_{label}.json'.
+
+    Parameters
+    ----------
+    volumes : list, optional
+        Numbers of loans to benchmark.
+        The default is (1000, 10000, 100000, 1000000).
+    products : int, optional
+        Number of products generated. The default is 6.
+    horizon : int, optional
+        Number of months calculated. The default is 120.
+    seed : int, optional
+        Random seed for 'data.make_loans'. The default is 0.
+    engine : str, optional
+        Cashflow calculation engine. The default is 'numpy'.
+    out : list, optional
+        Parameters kept for every month and output, as for Cashflow. Keeping
+        every parameter for a million loans needs over 10GB of memory.
+        The default is ['cashflow'].
+    output_format : str, optional
+        Format passed to 'Cashflow.output'. The default is 'csv'.
+    memory : Boolean, optional
+        True/False value defining whether to measure the peak memory of each
+        stage, which runs every stage twice (see 'measure').
+        The default is True.
+    path : str, optional
+        Directory the JSON results are saved in.
+        The default is "./Outputs/Benchmark".
+    label : str, optional
+        Name of this run, eg a version number. The default is None, which
+        uses the current git commit where available.
+    verbose : Boolean, optional
+        True/False indicating whether to print each result.
+        The default is True.
+
+    Returns
+    -------
+    dictionary
+        Benchmark results, as saved to file.
+    """
+    if label is None:
+        # use the current git commit to identify the version
+        try:
+            label = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            label = datetime.now().strftime('%Y%m%d%H%M%S')
+
+    benchmark = {
+        'label': label,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'engine': engine,
+        'out': out,
+        'output_format': output_format,
+        'products': products,
+        'horizon': horizon,
+        'results': []
+        }
+
+    # outputs are written to a temporary directory, removed after each run
+    scratch = tempfile.mkdtemp()
+    period_start = datetime(2022, 1, 1)
+    period_end = datetime(2022, 12, 1)
+    try:
+        for volume in volumes:
+            volume = int(volume)
+            loanbook, cpr, erc = d.make_loans(volume, products, horizon,
+                                              seed=seed)
+            loanbook = d.format_loanbook(loanbook, {}, verbose=False)
+            cpr = d.format_array(cpr, {'Product': 'product'})
+            erc = d.format_array(erc, {'Product': 'product'})
+
+            # run each stage in turn, passing results to the next
+            stages = {}
+            loanbook, stages['calc_loanbook'] = measure(
+                d.calc_loanbook, loanbook.copy(), verbose=False,
+                memory=memory)
+            cashflow, stages['Cashflow.__init__'] = measure(
+                mo.Cashflow, loanbook, erc, engine=engine, out=out,
+                memory=memory)
+            _, stages['calculate_cashflow'] = measure(
+                cashflow.calculate_cashflow, cpr, memory=memory)
+            _, stages['calculate_vals'] = measure(
+                cashflow.calculate_vals, period_start, period_end,
+                memory=memory)
+            _, stages['output'] = measure(
+                cashflow.output, path=scratch, out=out, format=output_format,
+                memory=memory)
+            del cashflow, loanbook
+
+            for stage in STAGES:
+                benchmark['results'].append(
+                    dict(volume=volume, stage=stage, **stages[stage]))
+                if verbose:
+                    peak = stages[stage]['peak_bytes']
+                    print(f"{volume:>9} loans | {stage:<18} | "
+                          f"{stages[stage]['wall']:9.3f}s | " +
+                          ('' if peak is None else f"{peak / 2**20:9.1f}MB"))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    # if output directory does not already exist, make it
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    full_path = os.path.join(path, f"benchmark_{label}.json")
+    with open(full_path, 'w') as fp:
+        json.dump(benchmark, fp, indent=4)
+    if verbose:
+        print(f"benchmark saved to '{full_path}'.")
+
+    return benchmark
+
+
+def compare(baseline, current):
+    """
+    Compares two saved benchmarks, giving the ratio of the current to the
+    baseline wall time and peak memory of each stage and volume, so values
+    above 1 are regressions.
+
+    Parameters
+    ----------
+    baseline : str
+        Path to the baseline benchmark JSON.
+    current : str
+        Path to the current benchmark JSON.
+
+    Returns
+    -------
+    Pandas DataFrame
+        Dataframe with one row per volume and stage found in both.
+    """
+    frames = []
+    for file in (baseline, current):
+        with open(file, 'r') as fp:
+            frames.append(pd.DataFrame(json.load(fp)['results'])
+                          .set_index(['volume', 'stage']))
+    ratio = (frames[1][['wall', 'peak_bytes']] /
+             frames[0][['wall', 'peak_bytes']]).dropna(how='all')
+    return ratio.rename(columns={'wall': 'wall_ratio',
+                                 'peak_bytes': 'memory_ratio'})
+
+
+if __name__ == '__main__':
+    # volumes can be given on the command line, eg 'python benchmark.py 1000'
+    run_benchmark(volumes=[int(float(v)) for v in sys.argv[1:]] or
+                  (1000, 10000, 100000, 1000000))
@@ -0,0 +1,193 @@
+"""
+Cache
+
+Developers:
+James Briggs
+
+Description:
+Script containing the on-disk result cache used by the Cashflow model. Per
+loan results are stored as SQLite blobs keyed by a fingerprint of the loan's
+inputs, so loans which have already been calculated with the same inputs
+can skip calculation entirely. The cache has a size cap, evicting the least
+recently used loans first.
+"""
+
+import os
+import sqlite3
+import time
+import numpy as np
+
+
+class ResultCache:
+    """
+    ResultCache stores per loan calculated arrays and EIR in a SQLite
+    database, keyed by loan fingerprint (see 'model.fingerprint').
+    """
+    def __init__(self, path="./Outputs/Cache/results.db", max_bytes=2**30):
+        """
+        Opens (or creates) the cache database.
+
+        Parameters
+        ----------
+        path : str, optional
+            Path to the SQLite database file.
+            The default is "./Outputs/Cache/results.db".
+        max_bytes : int, optional
+            Maximum total size of stored results, once exceeded the least
+            recently used loans are evicted.
+            The default is 2**30 (1 GiB).
+
+        Returns
+        -------
+        None.
+        """
+        # if cache directory does not already exist, make it
+        directory = os.path.dirname(path)
+        if directory != '' and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, m_max INTEGER, attrs TEXT, data BLOB, "
+            "eir REAL, converged INTEGER, iterations INTEGER, "
+            "size INTEGER, used INTEGER)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS results_used ON results (used)")
+        self.connection.commit()
+
+    def get(self, keys, attrs, m_max):
+        """
+        Looks up the stored results for a list of loan keys.
+
+        Parameters
+        ----------
+        keys : list
+            Loan keys (str) to look up.
+        attrs : list
+            Names of the arrays required, loans stored without all of these
+            count as misses.
+        m_max : int
+            Number of months required, loans stored with a different number
+            count as misses.
+
+        Returns
+        -------
+        found : dictionary
+            Dictionary of {position in keys: (rows, eir, converged,
+            iterations)} for each hit, where rows is an array of shape
+            (len(attrs), m_max) ordered as attrs.
+        """
+        position = {key: i for i, key in enumerate(keys)}
+        found = {}
+        unique = list(position)
+        for first in range(0, len(unique), 500):
+            batch = unique[first:first+500]
+            query = ("SELECT key, m_max, attrs, data, eir, converged, "
+                     "iterations FROM results WHERE key IN "
+                     f"({','.join('?' * len(batch))})")
+            for key, months, stored, data, eir, converged, iterations in \
+                    self.connection.execute(query, batch):
+                stored = stored.split(',')
+                if months != m_max or not set(attrs).issubset(stored):
+                    continue
+                rows = np.frombuffer(data, dtype=np.float64).reshape(
+                    len(stored), m_max)
+                rows = rows[[stored.index(attr) for attr in attrs]]
+                found[position[key]] = (rows, np.nan if eir is None else eir,
+                                        bool(converged), iterations)
+
+        # mark hits as recently used
+        self.connection.executemany(
+            "UPDATE results SET used = ? WHERE key = ?",
+            [(time.time_ns(), keys[i]) for i in found])
+        self.connection.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put(self, keys, attrs, rows, eir, converged, iterations):
+        """
+        Stores results for a list of loans, then evicts the least recently
+        used loans if the cache is over its size cap.
+
+        Parameters
+        ----------
+        keys : list
+            Loan keys (str).
+        attrs : list
+            Names of the arrays stored.
+        rows : numpy array
+            Array of shape (loans, len(attrs), m_max).
+        eir : numpy array
+            Calculated EIR of each loan.
+        converged : numpy array
+            EIR convergence flag of each loan.
+        iterations : numpy array
+            EIR solver iterations of each loan.
+
+        Returns
+        -------
+        None.
+        """
+        rows = np.ascontiguousarray(rows, dtype=np.float64)
+        now = time.time_ns()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(keys[i], rows.shape[2], ','.join(attrs), rows[i].tobytes(),
+              None if np.isnan(eir[i]) else float(eir[i]),
+              int(converged[i]), int(iterations[i]), rows[i].nbytes, now)
+             for i in range(len(keys))])
+        self.connection.commit()
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used loans until the stored results are
+        within the size cap.
+
+        Returns
+        -------
+        None.
+        """
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        remove = []
+        for key, size in self.connection.execute(
+                "SELECT key, size FROM results ORDER BY used"):
+            remove.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self.connection.executemany("DELETE FROM results WHERE key = ?",
+                                    remove)
+        self.connection.commit()
+
+    def size(self):
+        """
+        Returns the total size in bytes of the stored results.
+        """
+        return self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def clear(self):
+        """
+        Deletes every stored result and resets the hit and miss counts.
+        """
+        self.connection.execute("DELETE FROM results")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        self.connection.close()
@@ -13,8 +13,20 @@ import pandas as pd
 import re
 import os
 import json
+import hashlib
+from datetime import datetime
 import formulae as f
 
+# pyarrow is only needed for Parquet/Arrow output and fast CSV reading
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pc
+    import pyarrow.feather as pf
+    import pyarrow.parquet as pq
+    ARROW = True
+except ImportError:
+    ARROW = False
+
 
 # set the datatypes of modelling columns
 STR_COLS = ['loan_id', 'product']
@@ -189,7 +201,7 @@ class Mappings:
         return {self.data[key]: key for key in self.data}
 
 
-def output(df, path="./outputs", file="output"):
+def output(df, path="./outputs", file="output", append=False):
     """
     Function used to save csv's.
 
@@ -199,6 +211,10 @@ def output(df, path="./outputs", file="output"):
         DESCRIPTION. The default is "./outputs".
     preappend : TYPE, optional
         DESCRIPTION. The default is "".
+    append : Boolean, optional
+        True/False value defining whether to add rows to the end of an
+        existing file (without repeating the header) rather than overwrite it.
+        The default is False.
 
     Returns
     -------
@@ -216,24 +232,183 @@ def output(df, path="./outputs", file="output"):
     # merge path and file
     full_path = os.path.join(path, f"{file}.csv")
     
-    while True:
-        try:
-            df.to_csv(full_path, sep='|', index=False)
-            # update user
-            print(f"{file} data issues saved to "
-                  f"'{full_path}'.")
-            # if data saved successfully we break the while loop
-            break
-        except PermissionError:
-            # user or another has file open, request to close or rename
-            rename = input(f"'{full_path}' is open, please close and press <Enter>"
-                           " or type a new filename (and press <Enter>).")
-            if rename.strip() == '':
-                pass
-            elif '.csv' in rename.strip():
-                full_path = os.path.join(path, rename)  # merge path and file
+    # only append where there is already a file to append to
+    append = append and os.path.isfile(full_path)
+
+    try:
+        df.to_csv(full_path, sep='|', index=False,
+                  mode='a' if append else 'w', header=not append)
+    except PermissionError:
+        # user or another has file open, rather than wait for it to be
+        # closed we save to a new timestamped file
+        full_path = os.path.join(
+            path, f"{file}_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv")
+        print(f"Warning: '{file}.csv' is open elsewhere, saving to "
+              f"'{full_path}' instead.")
+        df.to_csv(full_path, sep='|', index=False)
+    # update user
+    print(f"{file} data issues saved to "
+          f"'{full_path}'.")
+
+
+class TableWriter:
+    """
+    TableWriter streams tables to a single Parquet or Arrow IPC file, one
+    row group (or record batch) per call to 'write', so large results can be
+    written in chunks without building the whole table in memory. Requires
+    pyarrow.
+    """
+    def __init__(self, path="./outputs", file="output", format='parquet',
+                 compression='zstd', append=False):
+        """
+        Initialises the writer, the file is created on the first write.
+
+        Parameters
+        ----------
+        path : str, optional
+            Directory to save the file in. The default is "./outputs".
+        file : str, optional
+            Filename, without extension. The default is "output".
+        format : str, optional
+            Either 'parquet' or 'arrow' (Arrow IPC file).
+            The default is 'parquet'.
+        compression : str, optional
+            Compression codec, eg 'zstd', 'lz4', 'snappy' (Parquet only), or
+            None. The default is 'zstd'.
+        append : Boolean, optional
+            Parquet and Arrow files cannot be added to once closed, so where
+            the file already exists this writes a new numbered part alongside
+            it (eg 'output_1.parquet'). The parts can be read back together
+            with pyarrow.dataset.
+            The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        if not ARROW:
+            raise ImportError("pyarrow is required for Parquet and Arrow "
+                              "output, install it or use CSV output.")
+        if format not in ('parquet', 'arrow'):
+            raise ValueError(f"'{format}' is not a valid format, use either "
+                             "'parquet' or 'arrow'.")
+
+        # if output directory does not already exist, make it
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        # find the file to write, numbering parts when appending
+        self.full_path = os.path.join(path, f"{file}.{format}")
+        part = 0
+        while append and os.path.isfile(self.full_path):
+            part += 1
+            self.full_path = os.path.join(path, f"{file}_{part}.{format}")
+
+        self.file = file
+        self.format = format
+        self.compression = compression
+        self.schema = None
+        self.writer = None
+        self.rows = 0
+
+    def write(self, table):
+        """
+        Writes a chunk of rows. The schema is taken from the first chunk,
+        later chunks are cast to it.
+
+        Parameters
+        ----------
+        table : Pandas DataFrame or pyarrow Table
+            Rows to write.
+
+        Returns
+        -------
+        None.
+
+        """
+        if isinstance(table, pd.DataFrame):
+            table = pa.Table.from_pandas(table, preserve_index=False)
+
+        if self.writer is None:
+            self.schema = table.schema
+            if self.format == 'parquet':
+                self.writer = pq.ParquetWriter(
+                    self.full_path, self.schema,
+                    compression=self.compression or 'none')
             else:
-                full_path = os.path.join(path, rename+'.csv')
+                self.writer = pa.ipc.new_file(
+                    self.full_path, self.schema,
+                    options=pa.ipc.IpcWriteOptions(
+                        compression=self.compression))
+        else:
+            table = table.cast(self.schema)
+
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        """
+        Closes the file, after which no more chunks can be written.
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            # update user
+            print(f"{self.file} data saved to '{self.full_path}'.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def grid_table(array, loan_id, product, name, layout='wide'):
+    """
+    Builds a pyarrow Table from a (loans, months) array.
+
+    Parameters
+    ----------
+    array : numpy array
+        Array of shape (loans, months).
+    loan_id : numpy array
+        loan_id of each row.
+    product : numpy array
+        Product of each row.
+    name : str
+        Column name of the values in the long layout.
+    layout : str, optional
+        Either 'wide', one row per loan with a column per month, or 'long',
+        one row per loan and month with 'month' and value columns.
+        The default is 'wide'.
+
+    Returns
+    -------
+    pyarrow Table
+        Table with 'loan_id' and 'product' columns followed by the values.
+
+    """
+    loans, months = array.shape
+    loan_id = pa.array(np.asarray(loan_id, dtype=str))
+    product = pa.array(np.asarray(product, dtype=str))
+    if layout == 'wide':
+        columns = {'loan_id': loan_id, 'product': product}
+        for m in range(months):
+            columns[str(m)] = pa.array(np.ascontiguousarray(array[:, m]))
+    elif layout == 'long':
+        rows = np.repeat(np.arange(loans), months)
+        columns = {
+            'loan_id': loan_id.take(pa.array(rows)),
+            'product': product.take(pa.array(rows)),
+            'month': pa.array(np.tile(np.arange(months, dtype=np.int16),
+                                      loans)),
+            name: pa.array(np.ascontiguousarray(array).ravel())
+            }
+    else:
+        raise ValueError(f"'{layout}' is not a valid layout, use either "
+                         "'wide' or 'long'.")
+    return pa.table(columns)
         
 
 def format_loanbook(loanbook, mapping, conv_full_term=False, verbose=True):
@@ -268,17 +443,8 @@ def format_loanbook(loanbook, mapping, conv_full_term=False, verbose=True):
     # if conv_full_term is True we assume rate_term values that are strings
     # are 'full term' and convert them to match term values / 12 (month > year)
     if conv_full_term:
-        # define numeric type checking function
-        def conv_rates(rate_term, term):
-            if str(rate_term).isnumeric():
-                return rate_term
-            else:
-                return float(term) / 12
-
-        # apply numeric checking function to dataframe
-        loanbook['rate_term'] = list(map(
-                conv_rates, loanbook['rate_term'], loanbook['term']
-                ))
+        loanbook['rate_term'] = full_term(loanbook['rate_term'],
+                                          loanbook['term'])
 
     # convert from external dtype to internal dtype
     for col in loanbook.columns:
@@ -308,6 +474,252 @@ def format_loanbook(loanbook, mapping, conv_full_term=False, verbose=True):
     return loanbook
 
 
+def full_term(rate_term, term):
+    """
+    Converts non-numeric 'rate_term' values, which are assumed to indicate
+    full-term, to the loan's term in years.
+
+    Parameters
+    ----------
+    rate_term : Pandas Series
+        Raw rate_term values.
+    term : Pandas Series
+        Term of each loan in months.
+
+    Returns
+    -------
+    Pandas Series
+        Numeric rate_term values.
+
+    """
+    # only whole numbers are kept as given, matching str.isnumeric
+    numeric = rate_term.astype(str).str.isnumeric().values
+    return pd.Series(
+        np.where(numeric, rate_term.where(numeric).astype(np.float64),
+                 pd.to_numeric(term) / 12),
+        index=rate_term.index)
+
+
+def read_loanbook(file, mapping, sep='|', conv_full_term=False,
+                  date_format=None, chunksize=100000, engine=None,
+                  verbose=True):
+    """
+    Reads and formats a raw loanbook file in a single pass, giving the same
+    frame as reading the file and passing it through 'format_loanbook':
+    numeric columns are int64 where every value is a whole number and none
+    are missing, float64 otherwise, dates are datetime64 and all other columns (including
+    adjustments) are strings. Text columns are read as text rather than
+    converted from parsed numbers, so a value such as '007' is kept as
+    written.
+
+    Parameters
+    ----------
+    file : str
+        Path to the raw loanbook CSV file.
+    mapping : dictionary
+        dictionary storing all column mappings in format:
+            EXTERNAL: INTERNAL
+    sep : str, optional
+        Column delimiter. The default is '|'.
+    conv_full_term : Boolean, optional
+        True/False value defining whether to assume non-numeric values in the
+        'rate_term' column indicate full-term and therefore default to 'term'
+        column value.
+    date_format : str, optional
+        strftime format of the date columns, eg '%Y-%m-%d'. If not given the
+        format is inferred from the first date.
+    chunksize : int, optional
+        Number of rows read at a time by the 'c' engine. The 'pyarrow' engine
+        reads the whole file at once (across several threads), so this has no
+        effect there. The default is 100000.
+    engine : str, optional
+        CSV engine, 'pyarrow' or 'c'. The default is None, which uses
+        'pyarrow' where installed and 'c' otherwise.
+    verbose : Boolean, optional
+        True/False indicating whether to print warnings to the console.
+
+    Returns
+    -------
+    pandas dataframe
+        Dataframe containing loan data, ready for 'calc_loanbook'.
+
+    """
+    if engine is None:
+        engine = 'pyarrow' if ARROW else 'c'
+
+    # read the header only and work out each column's dtype from its
+    # internal name
+    columns = pd.read_csv(file, sep=sep, nrows=0).columns
+    names = {col: mapping.get(col, col) for col in columns}
+    dtypes, dates = {}, []
+    for col in columns:
+        name = names[col]
+        if name in DATE_COLS:
+            dtypes[col] = 'datetime'
+            dates.append(name)
+        elif name == 'rate_term' and conv_full_term:
+            dtypes[col] = 'str'
+        elif name in NUM_COLS:
+            # left to the reader to infer, giving int64 or float64
+            dtypes[col] = 'numeric'
+        else:
+            if name not in STR_COLS and verbose:
+                print(f"WARNING: '{name}' datatype not set. This column "
+                      "will default to string.")
+            dtypes[col] = 'str'
+    numeric = [names[col] for col in columns if dtypes[col] == 'numeric']
+
+    def convert(chunk):
+        # rename columns to internal names and parse the remaining columns
+        chunk = chunk.rename(columns=names)
+        if conv_full_term and 'rate_term' in chunk.columns:
+            chunk['rate_term'] = full_term(chunk['rate_term'], chunk['term'])
+        for col in dates:
+            try:
+                chunk[col] = pd.to_datetime(
+                    chunk[col], format=date_format).astype('datetime64[us]')
+            except ValueError as e:
+                raise ValueError(f"ValueError for column '{col}':" + "\n" +
+                                 f"{e}")
+        # any text in a numeric column raises, as in 'format_loanbook'
+        for col in numeric:
+            try:
+                chunk[col] = pd.to_numeric(chunk[col])
+            except ValueError as e:
+                raise ValueError(f"ValueError for column '{col}':" + "\n" +
+                                 f"{e}")
+        return chunk
+
+    try:
+        if engine == 'pyarrow':
+            # pyarrow parses every column as it reads, dates included when
+            # their format is given (pyarrow would otherwise only accept ISO
+            # dates), else dates are read as text and parsed by 'convert'
+            types = {'str': pa.string(),
+                     'datetime': pa.timestamp('us') if date_format \
+                         else pa.string()}
+            table = pc.read_csv(
+                file, parse_options=pc.ParseOptions(delimiter=sep),
+                convert_options=pc.ConvertOptions(
+                    column_types={col: types[dtypes[col]] for col in columns
+                                  if dtypes[col] in types},
+                    timestamp_parsers=[date_format] if date_format \
+                        else None))
+            loanbook = convert(table.to_pandas())
+        else:
+            # the c engine reads dates as text, parsed chunk by chunk
+            dtypes = {col: 'str' for col in columns
+                      if dtypes[col] != 'numeric'}
+            loanbook = pd.concat(
+                [convert(chunk) for chunk in pd.read_csv(
+                    file, sep=sep, dtype=dtypes, engine=engine,
+                    chunksize=chunksize)],
+                ignore_index=True)
+    except ValueError as e:
+        raise ValueError(f"ValueError reading '{file}':" + "\n" + f"{e}")
+
+    return loanbook
+
+
+def load_loanbook(file, mapping, sep='|', conv_full_term=False,
+                  date_format=None, snapshot="./Outputs/Snapshots",
+                  refresh=False, verbose=True):
+    """
+    Reads, formats and calculates a raw loanbook file (see 'read_loanbook'
+    and 'calc_loanbook'), saving the result as a binary snapshot. Later calls
+    with the same file contents, mapping and flags load the snapshot instead,
+    any change to these gives a new snapshot. A snapshot is replaced only
+    when the contents of the same file change and it is read with the same
+    mapping and flags. This saves the time taken to parse and calculate the
+    loanbook, not memory: the snapshot is memory mapped while loading so the
+    file is not also read into memory, but the dataframe returned is an
+    in-memory copy as usual.
+
+    Parameters
+    ----------
+    file : str
+        Path to the raw loanbook CSV file.
+    mapping : dictionary
+        dictionary storing all column mappings in format:
+            EXTERNAL: INTERNAL
+    sep : str, optional
+        Column delimiter. The default is '|'.
+    conv_full_term : Boolean, optional
+        True/False value defining whether to assume non-numeric values in the
+        'rate_term' column indicate full-term and therefore default to 'term'
+        column value.
+    date_format : str, optional
+        strftime format of the date columns, see 'read_loanbook'.
+    snapshot : str, optional
+        Directory snapshots are saved in, or None to skip snapshots.
+        The default is "./Outputs/Snapshots".
+    refresh : Boolean, optional
+        True/False value defining whether to rebuild the snapshot even if
+        one exists. The default is False.
+    verbose : Boolean, optional
+        True/False indicating whether to print warnings to the console.
+
+    Returns
+    -------
+    pandas dataframe
+        Dataframe containing calculated loan data.
+
+    """
+    if snapshot is None:
+        return calc_loanbook(
+            read_loanbook(file, mapping, sep=sep,
+                          conv_full_term=conv_full_term,
+                          date_format=date_format, verbose=verbose),
+            verbose=verbose)
+
+    # fingerprint the file's location, mapping and flags as its source, and
+    # separately the file contents
+    source = hashlib.sha1(json.dumps(
+        [os.path.abspath(file), mapping, sep, conv_full_term, date_format],
+        sort_keys=True).encode()).hexdigest()[:16]
+    content = hashlib.sha1()
+    with open(file, 'rb') as fp:
+        for block in iter(lambda: fp.read(2**20), b''):
+            content.update(block)
+
+    # feather files are memory mapped on load, without pyarrow we pickle
+    ext = 'feather' if ARROW else 'pkl'
+    name = os.path.splitext(os.path.basename(file))[0]
+    prefix = f"{name}_{source}_"
+    full_path = os.path.join(snapshot,
+                             f"{prefix}{content.hexdigest()[:16]}.{ext}")
+
+    if os.path.isfile(full_path) and not refresh:
+        if ARROW:
+            return pf.read_table(full_path, memory_map=True).to_pandas()
+        return pd.read_pickle(full_path)
+
+    loanbook = calc_loanbook(
+        read_loanbook(file, mapping, sep=sep, conv_full_term=conv_full_term,
+                      date_format=date_format, verbose=verbose),
+        verbose=verbose)
+
+    # if snapshot directory does not already exist, make it
+    if not os.path.isdir(snapshot):
+        os.makedirs(snapshot)
+    # remove snapshots of previous contents of this file read with the same
+    # mapping and flags (snapshots of other files sharing the name, or of
+    # this file read with other flags, have another source key), then save
+    stale = re.compile(re.escape(prefix) + r"[0-9a-f]{16}\." + ext)
+    for old in os.listdir(snapshot):
+        if stale.fullmatch(old):
+            os.remove(os.path.join(snapshot, old))
+    if ARROW:
+        # uncompressed so the snapshot can be memory mapped
+        pf.write_feather(loanbook, full_path, compression='uncompressed')
+    else:
+        loanbook.to_pickle(full_path)
+    if verbose:
+        print(f"{name} snapshot saved to '{full_path}'.")
+
+    return loanbook
+
+
 def calc_loanbook(loanbook, verbose=True):
     """
     Formats loanbook data into the correct format for EIR processing.
@@ -331,10 +743,10 @@ def calc_loanbook(loanbook, verbose=True):
         index=loanbook.index)
 
     # amount that is repayed monthly
-    loanbook['monthly_repay'] = pd.Series(-np.pmt(
-        loanbook['initial_rate']/12,
-        loanbook['term'],
-        loanbook['total_repayment']),
+    loanbook['monthly_repay'] = pd.Series(-f.pmt(
+        loanbook['initial_rate'].values/12,
+        loanbook['term'].values,
+        loanbook['total_repayment'].values),
             index=loanbook.index)
 
     # initial monthly payment IO = interest rate * IO amt / months in year
@@ -346,39 +758,29 @@ def calc_loanbook(loanbook, verbose=True):
         (loanbook['reversion_rate']*loanbook['interest_only_amount'])/12,
         index=loanbook.index)
 
-    balance_on_reversion = []
-    # iterate through each loan and check we have correct data and if so
-    # perform calculation
-    for i in range(len(loanbook)):
-
-        cumprinc = f.princcum(
-            loanbook['initial_rate'].iloc[i]/12,
-            loanbook['term'].iloc[i],
-            loanbook['total_repayment'].iloc[i],
-            int(loanbook['rate_term'].iloc[i])*12,
-            1
-        )
-        balance_on_reversion.append(
-            loanbook['total_repayment'].iloc[i] - cumprinc)
-
-    loanbook['reversion_balance'] = pd.Series(balance_on_reversion,
-                                              index=loanbook.index)
-
-    monthly_repay_reversion = []
-    dtype_warning = 0  # initialise datatype issues counter
-    # iterate through each loan and check we have correct data and if so
-    # perform calculation
-    for i in range(len(loanbook)):
-        if loanbook['total_repayment'].iloc[i] != 0:
-            pmt = (-np.pmt(
-                loanbook['reversion_rate'].iloc[i] / 12,
-                loanbook['term'].iloc[i] - (
-                int(loanbook['rate_term'].iloc[i])*12),
-                loanbook['reversion_balance'].iloc[i]))
-            monthly_repay_reversion.append(pmt)
-        else:
-            dtype_warning += 1
-            monthly_repay_reversion.append(0)
+    # number of months at the initial rate, rate_term is given in whole years
+    rate_months = loanbook['rate_term'].values.astype(int) * 12
+
+    # calculate the principal repaid up to reversion for every loan at once
+    cumprinc = f.princcum(
+        loanbook['initial_rate'].values/12,
+        loanbook['term'].values,
+        loanbook['total_repayment'].values,
+        rate_months,
+        1
+    )
+    loanbook['reversion_balance'] = pd.Series(
+        loanbook['total_repayment'].values - cumprinc, index=loanbook.index)
+
+    # monthly repay after reversion can only be calculated where there is a
+    # repayment amount, otherwise it defaults to 0
+    has_repayment = loanbook['total_repayment'].values != 0
+    dtype_warning = int((~has_repayment).sum())  # datatype issues counter
+    monthly_repay_reversion = np.zeros(len(loanbook))
+    monthly_repay_reversion[has_repayment] = -f.pmt(
+        loanbook['reversion_rate'].values[has_repayment] / 12,
+        loanbook['term'].values[has_repayment] - rate_months[has_repayment],
+        loanbook['reversion_balance'].values[has_repayment])
 
     # warn user if some rows could not be converted
     if dtype_warning != 0 and verbose:
@@ -448,6 +850,179 @@ def format_array(array, mapping):
     return array
 
 
+def format_curves(curves, mapping, layout='wide', dtype=np.float64):
+    """
+    Formats a CPR Curves or ERC Lookup table into an array of curves, one row
+    per product and one column per month, ready for the Cashflow model.
+
+    Parameters
+    ----------
+    curves : Pandas DataFrame Object
+        dataframe containing raw curve data.
+    mapping : dictionary
+        dictionary storing all column mappings in format:
+            EXTERNAL: INTERNAL
+    layout : str, optional
+        Layout of the raw data. Options include:                            <br>
+        - 'wide': a 'product' column and one column per month, headers give
+           the month number (eg 'Month 12'), in any order                  <br>
+        - 'long': one row per product and month, with 'product' and 'month'
+           columns and a single value column                               <br>
+        The default is 'wide'.
+    dtype : numpy dtype, optional
+        Floating point precision of the curves. The default is np.float64.
+
+    Returns
+    -------
+    table : numpy array
+        Contiguous curves array of shape (products, months), empty values
+        are replaced with 0.
+    products : Pandas Index
+        Stripped and lowercased product of each row of table.
+
+    """
+    # rename columns to internal names using mapping dictionary
+    curves = curves.rename(columns={col: mapping[col] for col in curves.columns
+                                    if col in mapping})
+    if 'product' not in curves.columns:
+        raise KeyError("Curves must contain a 'product' column.")
+    names = curves['product'].astype(str).str.strip().str.lower()
+
+    if layout == 'long':
+        if 'month' not in curves.columns:
+            raise KeyError("Long curves must contain a 'month' column.")
+        values = [col for col in curves.columns
+                  if col not in ('product', 'month')]
+        if len(values) != 1:
+            raise ValueError("Long curves must contain exactly one value "
+                             f"column besides 'product' and 'month', not "
+                             f"{values}.")
+
+        try:
+            months = pd.to_numeric(curves['month']).values
+        except ValueError:
+            # month labels, eg 'Month 12' > 12
+            months = pd.to_numeric(curves['month'].astype(str).str.replace(
+                r'\D', '', regex=True)).values
+        if (months % 1 != 0).any() or (months < 0).any():
+            raise ValueError("Curve months must be whole numbers from 0.")
+        months = months.astype(np.int64)
+        rows, products = pd.factorize(names)
+        width = int(months.max()) + 1 if len(months) > 0 else 0
+
+        # place every value in its product row and month column at once
+        filled = np.zeros((len(products), width), dtype=np.int64)
+        np.add.at(filled, (rows, months), 1)
+        if (filled > 1).any():
+            raise ValueError("Curves contain more than one value for a month "
+                             "of products "
+                             f"{sorted(products[(filled > 1).any(axis=1)])}.")
+        table = np.zeros((len(products), width), dtype=dtype)
+        table[rows, months] = pd.to_numeric(curves[values[0]]).values
+        missing = filled == 0
+
+    elif layout == 'wide':
+        cols = [col for col in curves.columns if col != 'product']
+        # month number of every header, eg 'Month 12' > 12
+        digits = pd.Index(cols).astype(str).str.replace(r'\D', '', regex=True)
+        if (digits == '').any():
+            raise ValueError("Curve column headers "
+                             f"{[c for c, m in zip(cols, digits) if m == '']} "
+                             "do not contain a month number.")
+        months = digits.astype(np.int64).values
+        if pd.Index(months).has_duplicates:
+            raise ValueError("Curve column headers give the same month more "
+                             "than once.")
+
+        try:
+            values = curves[cols].to_numpy(dtype=dtype)
+        except (ValueError, TypeError):
+            # find the column that can not be converted for the error message
+            for col in cols:
+                try:
+                    pd.to_numeric(curves[col])
+                except ValueError as e:
+                    raise ValueError(f"ValueError for column '{col}':" +
+                                     "\n" + f"{e}")
+            raise
+
+        # order the columns by month
+        width = int(months.max()) + 1 if len(months) > 0 else 0
+        products = pd.Index(names)
+        table = np.zeros((len(products), width), dtype=dtype)
+        table[:, months] = values
+        missing = np.ones((len(products), width), dtype=bool)
+        missing[:, months] = False
+    else:
+        raise ValueError(f"'{layout}' is not a valid layout, use either "
+                         "'wide' or 'long'.")
+
+    products = pd.Index(products)
+    if products.has_duplicates:
+        raise ValueError("Curves contain more than one row for products "
+                         f"{sorted(set(products[products.duplicated()]))}.")
+    # every product must give every month from 0 to the final month
+    if missing.any():
+        raise ValueError("Curves must give every month from 0 to "
+                         f"{width - 1}, months "
+                         f"{sorted(set(np.nonzero(missing)[1].tolist()))} are missing "
+                         "for products "
+                         f"{sorted(products[missing.any(axis=1)])}.")
+
+    # empty cells can be replaced with 0
+    table[np.isnan(table)] = 0
+    return np.ascontiguousarray(table), products
+
+
+def load_curves(cpr, erc_lookup, mapping, layout='wide', dtype=np.float64,
+                verbose=True):
+    """
+    Formats raw CPR Curves and ERC Lookup tables with 'format_curves' and
+    checks that they agree, both must cover the same number of months.
+
+    Parameters
+    ----------
+    cpr : Pandas DataFrame Object
+        dataframe containing raw CPR Curves data.
+    erc_lookup : Pandas DataFrame Object
+        dataframe containing raw ERC Lookup data.
+    mapping : dictionary
+        dictionary storing all column mappings in format:
+            EXTERNAL: INTERNAL
+    layout : str, optional
+        Layout of the raw data, 'wide' or 'long'. The default is 'wide'.
+    dtype : numpy dtype, optional
+        Floating point precision of the curves. The default is np.float64.
+    verbose : Boolean, optional
+        True/False indicating whether to print warnings to the console.
+
+    Returns
+    -------
+    cpr : tuple
+        Tuple in format (table, products) of CPR curves.
+    erc_lookup : tuple
+        Tuple in format (table, products) of ERC curves.
+        Both tuples can be passed to Cashflow in place of formatted tables.
+
+    """
+    cpr = format_curves(cpr, mapping, layout, dtype)
+    erc_lookup = format_curves(erc_lookup, mapping, layout, dtype)
+
+    # the calculation runs for the horizon of the curves, so they must agree
+    if cpr[0].shape[1] != erc_lookup[0].shape[1]:
+        raise ValueError(f"CPR Curves cover {cpr[0].shape[1]} months but "
+                         f"ERC Lookup covers {erc_lookup[0].shape[1]}.")
+
+    # warn user of products which only have one of the two curves
+    unmatched = sorted(set(cpr[1]).symmetric_difference(erc_lookup[1]))
+    if len(unmatched) != 0 and verbose:
+        print(f"Warning: products {unmatched} do not have both a CPR Curve "
+              "and an ERC Lookup, loans of these products can not be "
+              "calculated.")
+
+    return cpr, erc_lookup
+
+
 def search_col(sheet, start, value, limit=200):
     """Searches a column in an openpyxl sheet for a specific value. This is to
     stop the script from breaking if users add/remove rows when entering
@@ -515,14 +1090,32 @@ def adjust(loanbook):
     return loanbook
 
 
-def make_loans(volume):
+def make_loans(volume, products=6, horizon=120, seed=None,
+               start="2019-01-01", adjustments=1):
     """
     Randomly generates a loanbook with corresponding CPR Curves and ERC Lookup.
+    The tables are in the same raw format as the sample data, so are
+    formatted with 'format_loanbook' and 'format_array' (mapping
+    {'Product': 'product'}) before use.
     
     Parameters
     ----------
     volume : int
         Number of loans to randomly generate.
+    products : int, optional
+        Number of products, each with its own CPR curve and ERC profile.
+        The default is 6.
+    horizon : int, optional
+        Number of months covered by the CPR curves and ERC profiles, no loan
+        has a longer term. The default is 120.
+    seed : int, optional
+        Random seed, the same seed always generates the same tables.
+        The default is None.
+    start : str, optional
+        Earliest origination date, loans originate over the following three
+        years. The default is "2019-01-01".
+    adjustments : int, optional
+        Number of adjustment columns. The default is 1.
     
     Returns
     -------
@@ -533,26 +1126,81 @@ def make_loans(volume):
     erc : Pandas DataFrame Object
         dataframe containing erc profiles
     """
-    # set the datatypes of modelling columns
-    #STR_COLS = ['loan_id', 'product']
-    
-    #DATE_COLS = ['origination_date', 'reversion_date']
-    
-    #NUM_COLS = ['rate_term', 'loan_amount', 'initial_rate', 'reversion_rate',
-    #            'term', 'interest_only_amount', 'upfront_fees', 'upfront_costs',
-    #            'entity_eir']
-
-    # initialise loanbook data
-    loanbook = pd.DataFrame({'loan_id': range(volume)})
-
-    # randomly select number of products
-    num_products = round(volume / np.random.randint(2, 5))
-
-    # create list of product names from this
-    products = [f"Product {i}" for i in range(num_products)]
-
-    # initialise
-
-    # create random origination dates within a range
-    raise ValueError("Function not built yet.")
+    if volume < 1 or products < 1 or horizon < 2:
+        raise ValueError("'volume' and 'products' must be at least 1 and "
+                         "'horizon' at least 2.")
+    rng = np.random.default_rng(seed)
+
+    # create list of product names, each product has its own base rates
+    names = np.array([f"Product {i}" for i in range(products)])
+    product = rng.integers(0, products, volume)
+    base_rate = rng.uniform(0.02, 0.08, products)
+    base_margin = rng.uniform(0.01, 0.04, products)
+
+    # terms run up to the horizon, rate terms (in whole years) always end
+    # before the term does
+    term = rng.integers(min(72, horizon - 1), horizon + 1, volume)
+    rate_term = np.minimum(rng.choice([2, 3, 5], volume, p=[0.4, 0.3, 0.3]),
+                           (term - 1) // 12)
+
+    # random origination dates within three years of start, reverting after
+    # the rate term
+    month = np.datetime64(start, 'M') + rng.integers(0, 36, volume)
+    day = rng.integers(0, 28, volume)
+    origination = month.astype('datetime64[D]') + day
+    reversion = (month + rate_term * 12).astype('datetime64[D]') + day
+
+    # loan amounts are roughly log-normal, with some part interest only
+    loan_amount = np.round(rng.lognormal(np.log(150000), 0.8, volume), 2)
+    interest_only = np.where(rng.random(volume) < 0.1,
+                             np.round(loan_amount * rng.uniform(0.2, 1.0,
+                                                                volume), 2),
+                             0.)
+
+    initial_rate = np.round(
+        base_rate[product] + rng.normal(0, 0.005, volume), 4).clip(0.001)
+    reversion_rate = np.round(
+        initial_rate + base_margin[product] + rng.uniform(0, 0.01, volume), 4)
+
+    loanbook = pd.DataFrame({
+        'loan_id': np.arange(volume),
+        'product': names[product],
+        'rate_term': rate_term,
+        'origination_date': pd.to_datetime(origination).strftime('%Y-%m-%d'),
+        'reversion_date': pd.to_datetime(reversion).strftime('%Y-%m-%d'),
+        'loan_amount': loan_amount,
+        'initial_rate': initial_rate,
+        'reversion_rate': reversion_rate,
+        'term': term,
+        'interest_only_amount': interest_only,
+        'upfront_fees': rng.choice(np.arange(0, 6500, 500), volume),
+        'upfront_costs': rng.choice(np.arange(2600, 3600, 200), volume)
+        })
+
+    # adjustments fall in the months after the last origination, most loans
+    # have no adjustment
+    for i in range(adjustments):
+        date = pd.Timestamp(np.datetime64(start, 'M') + 36 + i)
+        loanbook[f"adjust {date.strftime('%b-%y')}"] = np.where(
+            rng.random(volume) < 0.2,
+            rng.choice(np.arange(200, 1600, 200), volume), 0)
+
+    # cpr curves give the fraction of loans remaining, starting at 1 and
+    # prepaying at a random monthly rate per product until the horizon
+    hazard = rng.uniform(0.005, 0.03, (products, 1)) * \
+        rng.uniform(0.5, 1.5, (products, horizon - 2))
+    curves = np.ones((products, horizon))
+    curves[:, 2:] = np.cumprod(1 - hazard, axis=1)
+    curves[:, -1] = 0
+    cpr = pd.DataFrame(curves, columns=[str(m) for m in range(horizon)])
+    cpr.insert(0, 'Product', names)
+
+    # erc profiles give the charge as a fraction of the early repayment
+    charges = rng.uniform(0.02, 0.035, (products, 1)) + \
+        rng.normal(0, 0.003, (products, horizon))
+    erc = pd.DataFrame(charges.clip(0),
+                       columns=[f"Month {m}" for m in range(horizon)])
+    erc.insert(0, 'Product', names)
+
+    return loanbook, cpr, erc
         
@@ -10,21 +10,76 @@ Script containing more complex calculations for Cashflow modelling.
 
 import numpy as np
 
+# numba is optional, without it the fused kernel runs as plain python and the
+# cashflow model should use its numpy engine instead
+try:
+    from numba import njit, prange
+    NUMBA = True
+except ImportError:
+    NUMBA = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        # stand-in decorator returning the function unchanged
+        return lambda func: func
+
+
+def pmt(rate, nper, pv, fv=0, when=0):
+    """
+    Calculates the fixed periodic payment of an annuity. This replaces the
+    'np.pmt' function removed from newer NumPy releases, follows the same sign
+    convention, and works element-wise on scalars or arrays.
+
+    Parameters
+    ----------
+    rate : float or numpy array
+        Interest rate per period.
+    nper : int or numpy array
+        Number of periods.
+    pv : float or numpy array
+        Present value (eg the loan principal).
+    fv : float or numpy array, optional
+        Future value remaining after the final payment. The default is 0.
+    when : int, optional
+        Integer flag, payment at the beginning (1), end of the period (0).
+        The default is 0.
+
+    Returns
+    -------
+    float or numpy array
+        Payment per period (negative for a positive present value).
+
+    """
+
+    rate, nper, pv, fv = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) for x in (rate, nper, pv, fv)])
+    # where the rate is zero the annuity factor is simply the number of periods
+    zero = rate == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        temp = (1 + rate) ** nper
+        fact = np.where(zero, nper,
+                        (1 + rate * when) * (temp - 1) / np.where(zero, 1, rate))
+        payment = -(fv + pv * temp) / fact
+    # return a scalar if we were given scalars
+    return payment if payment.ndim else payment.item()
+
 
 def princcum(rate, nper, loan_amount, period, when):
     """
     Calculates the cumulative principal repaid between the first month
-    and the m-th month of a loan.
+    and the m-th month of a loan. The balance is rolled forward in closed form
+    so all parameters may be given as equal length arrays to calculate every
+    loan at once.
 
     Parameters
     ----------
-    rate : float
+    rate : float or numpy array
         Interest rate.
-    nper : int
+    nper : int or numpy array
         Number of periods in loan term.
-    loan_amount : float or int
+    loan_amount : float or numpy array
         Loan principal.
-    m : int
+    period : int or numpy array
         Loan month up to which we should calculate.
     when : int
         Integer flag, repayment at the beginning (1), end of the month (0).
@@ -32,38 +87,263 @@ def princcum(rate, nper, loan_amount, period, when):
 
     Returns
     -------
-    float
+    float or numpy array
         Cumulative principal repaid.
 
     """
 
-    principal_paid = 0  # initialise the cumulative principal amount
-    repay = -np.pmt(rate, nper, loan_amount, 0, when)  # calculate monthly repay
+    rate = np.asarray(rate, dtype=float)
+    loan_amount = np.asarray(loan_amount, dtype=float)
+    period = np.asarray(period)
+    repay = -np.asarray(pmt(rate, nper, loan_amount, 0, when))  # monthly repay
 
+    balance = loan_amount
     if when == 1:
-        # if the repay is calculated at the  start of the month, calculate
-        # the first month now
-        loan_amount -= repay
-        principal_paid += repay
-        period -= 1  # remember to reduce number of months by 1
-
-    # begin iterating through each month in period
-    for i in range(period):
-        # calculate the amount generated by interest this month
-        month_interest = loan_amount * rate
-        paid_off = repay - month_interest  # how much is paid off?
-        principal_paid += paid_off  # calculate the cumulative amount paid
-        loan_amount -= paid_off  # calculate the amount left to pay
+        # if the repay is calculated at the start of the month, the whole of
+        # the first repayment is principal
+        balance = balance - repay
+        period = period - 1  # remember to reduce number of months by 1
+    # no further months are rolled forward if the period is already used up
+    period = np.maximum(period, 0)
+
+    # each month the balance grows by interest and falls by the repayment,
+    # B_n = B_0 * (1 + r)^n - repay * ((1 + r)^n - 1) / r, or simply
+    # B_n = B_0 - repay * n where the rate is zero
+    growth = (1 + rate) ** period
+    zero = rate == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = np.where(zero, period,
+                           (growth - 1) / np.where(zero, 1, rate))
+    balance = balance * growth - repay * annuity
 
     # return the cumulative amount paid
-    return principal_paid
+    principal_paid = loan_amount - balance
+    return principal_paid if principal_paid.ndim else principal_paid.item()
+
+
+def _polyval(cashflows_t, v):
+    """
+    Evaluates sum(cashflow_t * v^t) and its first and second derivatives in v
+    with Horner's method, for every row at once.
+
+    Parameters
+    ----------
+    cashflows_t : numpy array
+        Transposed cashflows, shape (periods, loans).
+    v : numpy array
+        Discount factor 1 / (1 + rate), shape (loans,) or (loans, points).
+
+    Returns
+    -------
+    p, dp, d2p : numpy array
+        Polynomial value and first and second derivatives.
+    """
+    # add trailing axes so the cashflows broadcast against v
+    coeffs = cashflows_t.reshape(cashflows_t.shape + (1,) * (v.ndim - 1))
+    p = np.zeros_like(v)
+    dp = np.zeros_like(v)
+    d2p = np.zeros_like(v)
+    for c in coeffs[::-1]:
+        d2p = d2p * v + dp
+        dp = dp * v + p
+        p = p * v + c
+    return p, dp, 2 * d2p
+
+
+def irr(cashflows, guess=None, tol=1e-12, maxiter=50, bounds=(-0.5, 1.),
+        batch_size=100000):
+    """
+    Calculates the internal rate of return (per period) of every row of a
+    cashflow array at once. Each row is solved with Halley's method from
+    'guess', and rows which do not converge fall back to bisection within
+    the sign change closest to a zero rate inside 'bounds'. Rows whose
+    cashflows never change sign (including all-zero rows) have no rate and
+    return NaN.
+
+    Parameters
+    ----------
+    cashflows : numpy array
+        Cashflows of shape (loans, periods), or a single row of cashflows.
+    guess : float or numpy array, optional
+        Starting rate for each row, non-finite values start from 0.
+        The default is None (start from 0).
+    tol : float, optional
+        Convergence tolerance on the relative change in discount factor.
+        The default is 1e-12.
+    maxiter : int, optional
+        Maximum number of Halley iterations.
+        The default is 50.
+    bounds : tuple, optional
+        Lowest and highest rate searched by the bisection fallback.
+        The default is (-0.5, 1.).
+    batch_size : int, optional
+        Number of rows solved together, limiting working memory.
+        The default is 100000.
+
+    Returns
+    -------
+    rate : numpy array
+        Internal rate of return of each row, NaN where none was found.
+    converged : numpy array
+        Boolean array, True where a rate was found.
+    iterations : numpy array
+        Number of iterations used for each row.
+    """
+
+    cashflows = np.atleast_2d(np.asarray(cashflows, dtype=np.float64))
+    loans = cashflows.shape[0]
+    if guess is None:
+        guess = 0.
+    guess = np.broadcast_to(np.asarray(guess, dtype=np.float64), (loans,))
+
+    rate = np.full(loans, np.nan)
+    converged = np.zeros(loans, dtype=bool)
+    iterations = np.zeros(loans, dtype=np.int64)
+
+    for start in range(0, loans, batch_size):
+        rows = slice(start, start + batch_size)
+        cf_t = np.ascontiguousarray(cashflows[rows].T)
+        # a rate only exists where the cashflows change sign
+        solvable = (cf_t > 0).any(axis=0) & (cf_t < 0).any(axis=0)
+
+        # we solve for the discount factor v = 1 / (1 + rate)
+        r0 = guess[rows]
+        r0 = np.where(np.isfinite(r0) & (r0 > -1), r0, 0.)
+        v = 1 / (1 + r0)
+        done = ~solvable
+        found = np.zeros(len(v), dtype=bool)
+        its = np.zeros(len(v), dtype=np.int64)
+
+        for _ in range(maxiter):
+            active = np.flatnonzero(~done)
+            if active.size == 0:
+                break
+            p, dp, d2p = _polyval(cf_t[:, active], v[active])
+            # Halley step, falling back to a Newton step where the Halley
+            # denominator vanishes
+            with np.errstate(divide='ignore', invalid='ignore',
+                             over='ignore'):
+                denominator = 2 * dp * dp - p * d2p
+                step = np.where(denominator != 0,
+                                2 * p * dp / denominator, p / dp)
+            v_new = v[active] - step
+            its[active] += 1
+            # stop rows that have left the valid range, they are bracketed
+            failed = ~np.isfinite(v_new) | (v_new <= 0)
+            ok = ~failed & (np.abs(step) <= tol * np.abs(v_new))
+            v[active] = np.where(failed, v[active], v_new)
+            found[active[ok]] = True
+            done[active[ok | failed]] = True
+
+        # bisection fallback for solvable rows that did not converge
+        rest = np.flatnonzero(solvable & ~found)
+        if rest.size > 0:
+            v[rest], found[rest], its[rest] = _bisect(
+                cf_t[:, rest], bounds, tol, its[rest])
+
+        with np.errstate(divide='ignore'):
+            rate[rows] = np.where(found, 1 / v - 1, np.nan)
+        converged[rows] = found
+        iterations[rows] = its
+
+    return rate, converged, iterations
+
+
+def discounted_total(rate, cashflows):
+    """
+    Calculates, for every row of a cashflow array, the total of the
+    cashflows from each month to the end discounted to month 0. The net
+    present value at month s of the cashflows from s onwards is then
+    total[:, s] * (1 + rate)^s.
+
+    Parameters
+    ----------
+    rate : numpy array
+        Discount rate (per period) for each row.
+    cashflows : numpy array
+        Cashflows of shape (loans, periods).
+
+    Returns
+    -------
+    total : numpy array
+        Discounted totals of shape (loans, periods + 1), the final column is
+        zero. Rows are NaN where the rate is NaN.
+    """
+    rate = np.asarray(rate, dtype=np.float64)[:, np.newaxis]
+    months = np.arange(cashflows.shape[1])
+    # discount factors (1 + rate)^-month for every loan and month
+    with np.errstate(over='ignore', invalid='ignore'):
+        discounted = cashflows * np.exp(-np.log1p(rate) * months)
+    # running total from the final month backwards
+    total = np.zeros((cashflows.shape[0], cashflows.shape[1] + 1))
+    np.cumsum(discounted[:, ::-1], axis=1, out=total[:, -2::-1])
+    return total
+
+
+def _bisect(cashflows_t, bounds, tol, iterations, points=151):
+    """
+    Bisection on the discount factor within the sign change closest to a
+    zero rate, used as the fallback for 'irr'.
+
+    Parameters
+    ----------
+    cashflows_t : numpy array
+        Transposed cashflows, shape (periods, loans).
+    bounds : tuple
+        Lowest and highest rate searched.
+    tol : float
+        Convergence tolerance on the discount factor.
+    iterations : numpy array
+        Iterations used so far by each row.
+    points : int, optional
+        Number of grid points used to find sign changes.
+        The default is 151.
+
+    Returns
+    -------
+    v : numpy array
+        Discount factor of each row.
+    found : numpy array
+        Boolean array, True where a sign change was found.
+    iterations : numpy array
+        Updated number of iterations.
+    """
+    loans = cashflows_t.shape[1]
+    # grid of rates, ordered by distance from zero so the first sign change
+    # found is the one closest to a zero rate
+    grid = np.linspace(bounds[0], bounds[1], points)
+    v_grid = 1 / (1 + grid)
+    p = _polyval(cashflows_t, np.broadcast_to(v_grid, (loans, points)).copy())[0]
+    change = np.sign(p[:, :-1]) * np.sign(p[:, 1:]) <= 0
+    distance = np.minimum(np.abs(grid[:-1]), np.abs(grid[1:]))
+    order = np.argsort(distance, kind='stable')
+    first = order[np.argmax(change[:, order], axis=1)]
+    found = change[np.arange(loans), first]
+
+    lo = v_grid[first + 1]  # higher rate, lower discount factor
+    hi = v_grid[first]
+    p_lo = p[np.arange(loans), first + 1]
+    # each halving of the bracket adds an iteration
+    while True:
+        width = hi - lo
+        if not (found & (width > tol * hi)).any():
+            break
+        mid = (lo + hi) / 2
+        p_mid = _polyval(cashflows_t, mid)[0]
+        lower = np.sign(p_mid) == np.sign(p_lo)
+        lo = np.where(lower, mid, lo)
+        p_lo = np.where(lower, p_mid, p_lo)
+        hi = np.where(lower, hi, mid)
+        iterations = iterations + (found & (width > tol * hi))
+
+    return (lo + hi) / 2, found, iterations
 
 
 def func_scheduled_payment(m, loan_amount, reversion, cpy_prev, ostmt, epmt_prev,
                           spmt_prev, monthly_repay_io, monthly_repay,
                           monthly_repay_reversion, monthly_repay_io_reversion):
     """
-    Calculation of scheduled payment. Incompatible with arrays, vectorised
+    Calculation of scheduled payment. Incompatible with arrays, array
     implementation provided by 'v_scheduled_payment'.
 
     Parameters
@@ -114,8 +394,76 @@ def func_scheduled_payment(m, loan_amount, reversion, cpy_prev, ostmt, epmt_prev
 
     return spmt
 
-# vectorised implementation of scheduled payment function
-v_scheduled_payment = np.vectorize(func_scheduled_payment)
+def v_scheduled_payment(m, loan_amount, reversion, cpy_prev, ostmt, epmt_prev,
+                        spmt_prev, monthly_repay_io, monthly_repay,
+                        monthly_repay_reversion, monthly_repay_io_reversion,
+                        out=None):
+    """
+    Array implementation of 'func_scheduled_payment', calculating the
+    scheduled payment for all loans in a single month. The month 1, reversion
+    month, and zero denominator branches are applied as boolean masks.
+
+    Parameters
+    ----------
+    m : int
+        Current month index.
+    loan_amount : numpy array
+        The initial loan amount.
+    reversion : numpy array
+        Reversion month index.
+    cpy_prev : numpy array
+        Cumulative prepayment from the previous month.
+    ostmt : numpy array
+        Statement amount from the previous month.
+    epmt_prev : numpy array
+        Early prepayment from the previous month.
+    spmt_prev : numpy array
+        Scheduled payment from the previous month.
+    monthly_repay_io : numpy array
+        Monthly repay amount (interest only).
+    monthly_repay : numpy array
+        Monthly repay amount.
+    monthly_repay_reversion : numpy array
+        Monthly repay amount after the reversion date.
+    monthly_repay_io_reversion : numpy array
+        Monthly repay amount (interest only) after the reversion date.
+    out : numpy array, optional
+        Preallocated array (or array view) the result is written into. If not
+        given, a new array is allocated.
+
+    Returns
+    -------
+    out : numpy array
+        Calculated scheduled payment.
+    """
+
+    if out is None:
+        out = np.empty(np.shape(loan_amount))
+
+    if m == 1:
+        # IO = interest only, every loan takes the month 1 calculation
+        np.negative(monthly_repay_io, out=out)
+        np.subtract(out, monthly_repay, out=out)
+        return out
+
+    # default calculation, where the denominator is zero the payment is zero
+    denominator = ostmt - epmt_prev
+    nonzero = denominator != 0
+    np.multiply(ostmt, spmt_prev, out=out)
+    np.divide(out, denominator, out=out, where=nonzero)
+    out[~nonzero] = 0
+
+    # at the reversion date we have a slightly different calculation, loans
+    # are the last axis so leading (eg scenario) axes are also supported
+    rev = reversion - 1 == m
+    if rev.any():
+        amount = loan_amount[rev]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[..., rev] = -(monthly_repay_reversion[rev] +
+                              monthly_repay_io_reversion[rev]) * \
+                              (amount - cpy_prev[..., rev]) / amount
+
+    return out
 
 
 def cum_prepayment(cpy_prev, amount, cam, cpr, cpr_prev):
@@ -148,7 +496,8 @@ def cum_prepayment(cpy_prev, amount, cam, cpr, cpr_prev):
 
 def func_early_repayment(ostmt, sint, spmt, cpy_prev, cpy):
     """
-    Calculation of early repayment.
+    Calculation of early repayment. Incompatible with arrays, array
+    implementation provided by 'v_early_repayment'.
 
     Parameters
     ----------
@@ -180,8 +529,46 @@ def func_early_repayment(ostmt, sint, spmt, cpy_prev, cpy):
         return -(ostmt + sint + spmt)
 
 
-# vectorised implementation of early repayment calculation
-v_early_repayment = np.vectorize(func_early_repayment)
+def v_early_repayment(ostmt, sint, spmt, cpy_prev, cpy, out=None):
+    """
+    Array implementation of 'func_early_repayment', calculating the early
+    repayment for all loans in a single month.
+
+    Parameters
+    ----------
+    ostmt : numpy array
+        Statement amount from the previous month.
+    sint : numpy array
+        Statement interest for the current month.
+    spmt : numpy array
+        Scheduled payment for the current month.
+    cpy_prev : numpy array
+        Cumulative payment from the previous month.
+    cpy : numpy array
+        Cumulative payment for the current month.
+    out : numpy array, optional
+        Preallocated array (or array view) the result is written into. If not
+        given, a new array is allocated.
+
+    Returns
+    -------
+    out : numpy array
+        Calculated early repayment.
+    """
+
+    if out is None:
+        out = np.empty(np.shape(ostmt))
+
+    # previous statement balance + current interest + current scheduled payment
+    np.add(ostmt, sint, out=out)
+    np.add(out, spmt, out=out)
+    # where this plus the change in cumulative prepayment is positive, the
+    # early repayment is the previous - current cumulative prepayment amount
+    prepaid = (out + cpy_prev) - cpy > 0
+    np.negative(out, out=out)
+    np.subtract(cpy_prev, cpy, out=out, where=prepaid)
+
+    return out
 
 
 def cashflow_calc(prev_amt, prev_costs, prev_fees, prev_spmt, prev_epmt,
@@ -216,3 +603,168 @@ def cashflow_calc(prev_amt, prev_costs, prev_fees, prev_spmt, prev_epmt,
     # calculate the cashflow and return
     return prev_amt + prev_costs - prev_fees + \
            prev_spmt + prev_epmt + erc + adjustments
+
+
+@njit(parallel=True, cache=True, error_model='numpy')
+def fused_cashflow(loan_amount, upfront_costs, upfront_fees, reversion,
+                   monthly_repay_io, monthly_repay, monthly_repay_reversion,
+                   monthly_repay_io_reversion, initial_rate, reversion_rate,
+                   cpr_curves, cpr_index, erc_curves, erc_index, adjust_start,
+                   adjust_month, adjust_amount, scheduled_payment,
+                   statement_interest,
+                   cumulative_amortisation, cumulative_payment,
+                   early_repayment, early_repayment_charge, cashflow,
+                   profit_and_loss, statement_amount):
+    """
+    Runs the full month-by-month cashflow recurrence in a single loop per
+    loan, holding the previous month's values as scalars rather than reading
+    them back from the arrays. The calculations match 'func_scheduled_payment',
+    'cum_prepayment', 'func_early_repayment' and 'cashflow_calc'. When numba
+    is installed this is compiled and loans are run in parallel across cores.
+
+    Parameters
+    ----------
+    loan_amount : numpy array
+        The initial loan amount of each loan.
+    upfront_costs : numpy array
+        Upfront costs of each loan (month 0 only).
+    upfront_fees : numpy array
+        Upfront fees of each loan (month 0 only).
+    reversion : numpy array
+        Reversion month index of each loan.
+    monthly_repay_io : numpy array
+        Monthly repay amount (interest only).
+    monthly_repay : numpy array
+        Monthly repay amount.
+    monthly_repay_reversion : numpy array
+        Monthly repay amount after the reversion date.
+    monthly_repay_io_reversion : numpy array
+        Monthly repay amount (interest only) after the reversion date.
+    initial_rate : numpy array
+        Interest rate of each loan before the reversion month.
+    reversion_rate : numpy array
+        Interest rate of each loan from the reversion month.
+    cpr_curves : numpy array
+        CPR curves array, shape (products, months).
+    cpr_index : numpy array
+        Row of 'cpr_curves' giving the CPR curve of each loan.
+    erc_curves : numpy array
+        ERC lookup curves array, shape (products, months).
+    erc_index : numpy array
+        Row of 'erc_curves' giving the ERC curve of each loan.
+    adjust_start : numpy array
+        Position of the first adjustment entry of each loan, with a final
+        value giving the number of entries, so the entries of loan i are
+        adjust_start[i]:adjust_start[i+1].
+    adjust_month : numpy array
+        Month of each adjustment entry, sorted by month within each loan.
+    adjust_amount : numpy array
+        Amount of each adjustment entry.
+    scheduled_payment, statement_interest, cumulative_amortisation,
+    cumulative_payment, early_repayment, early_repayment_charge, cashflow,
+    profit_and_loss, statement_amount : numpy array
+        Output arrays of shape (loans, months), written from month 1 onwards.
+        Any of these may instead be a (loans, 2) rolling buffer, in which case
+        month m is written to column m % 2. Month 0 of 'statement_amount' must
+        already hold the loan amount.
+
+    Returns
+    -------
+    None.
+    """
+
+    loans, m_max = loan_amount.shape[0], cpr_curves.shape[1]
+    # width of each output, full arrays are m_max wide and buffers 2 wide
+    w_spmt = scheduled_payment.shape[1]
+    w_sint = statement_interest.shape[1]
+    w_cam = cumulative_amortisation.shape[1]
+    w_cpy = cumulative_payment.shape[1]
+    w_epmt = early_repayment.shape[1]
+    w_erc = early_repayment_charge.shape[1]
+    w_cf = cashflow.shape[1]
+    w_pls = profit_and_loss.shape[1]
+    w_stmt = statement_amount.shape[1]
+    for i in prange(loans):
+        amount = loan_amount[i]
+        cpr = cpr_curves[cpr_index[i]]
+        erc_lookup = erc_curves[erc_index[i]]
+        # month 0 values are the previous month values for month 1
+        spmt_prev = 0.
+        epmt_prev = 0.
+        sint_prev = 0.
+        cam_prev = 0.
+        cpy_prev = 0.
+        pls_prev = 0.
+        ostmt = statement_amount[i, 0]
+        # loan amount, costs and fees only enter the month 1 cashflow
+        upfront = amount + upfront_costs[i] - upfront_fees[i]
+        # next adjustment entry of this loan
+        a = adjust_start[i]
+
+        for m in range(1, m_max):
+            # scheduled payment
+            if m == 1:
+                spmt = -monthly_repay_io[i] - monthly_repay[i]
+            elif m == reversion[i] - 1:
+                spmt = -(monthly_repay_reversion[i] +
+                         monthly_repay_io_reversion[i]) * \
+                         (amount - cpy_prev) / amount
+            elif ostmt - epmt_prev != 0:
+                spmt = (ostmt * spmt_prev) / (ostmt - epmt_prev)
+            else:
+                spmt = 0.
+
+            # statement interest and cumulative amortisation
+            if m < reversion[i]:
+                sint = initial_rate[i] * ostmt / 12
+            else:
+                sint = reversion_rate[i] * ostmt / 12
+            cam = sint_prev + spmt_prev + cam_prev
+
+            # cumulative prepayment
+            cpy = cpy_prev + (amount + cam) * ((1-cpr[m]) -
+                                               (1-cpr[m-1]))
+
+            # early repayment and early repayment charge
+            due = ostmt + sint + spmt
+            if due + cpy_prev - cpy > 0:
+                epmt = cpy_prev - cpy
+            else:
+                epmt = -due
+            erc = erc_lookup[m] * epmt
+
+            # this month's adjustment, if the loan has one (entries in month
+            # 0 never enter the cashflow so are skipped)
+            while a < adjust_start[i+1] and adjust_month[a] < m:
+                a += 1
+            adjustment = 0.
+            if a < adjust_start[i+1] and adjust_month[a] == m:
+                adjustment = adjust_amount[a]
+
+            # cashflow, profit and loss, and statement amount
+            if m == 1:
+                cf = upfront + spmt_prev + epmt_prev + erc + adjustment
+            else:
+                cf = spmt_prev + epmt_prev + erc + adjustment
+            pls = pls_prev - cf
+            cstmt = due + epmt
+
+            # write this month's values to the output arrays
+            scheduled_payment[i, m % w_spmt] = spmt
+            statement_interest[i, m % w_sint] = sint
+            cumulative_amortisation[i, m % w_cam] = cam
+            cumulative_payment[i, m % w_cpy] = cpy
+            early_repayment[i, m % w_epmt] = epmt
+            early_repayment_charge[i, m % w_erc] = erc
+            cashflow[i, m % w_cf] = cf
+            profit_and_loss[i, m % w_pls] = pls
+            statement_amount[i, m % w_stmt] = cstmt
+
+            # and carry them forward as the previous month values
+            spmt_prev = spmt
+            epmt_prev = epmt
+            sint_prev = sint
+            cam_prev = cam
+            cpy_prev = cpy
+            pls_prev = pls
+            ostmt = cstmt
@@ -0,0 +1,215 @@
+"""
+Instrument
+
+Developers:
+James Briggs
+
+Description:
+Script containing the optional instrumentation used to find where the time
+and memory of a cashflow run goes. An Instrument records the wall and CPU
+time and array bytes allocated of each stage, with the process peak RSS as
+the stage ends, and optionally the time of every month of the calculation
+loop. Each record can be passed to a callback or logger as it is taken.
+"""
+
+import sys
+import time
+import inspect
+import functools
+import numpy as np
+import pandas as pd
+
+# resource is only available on Unix, without it peak RSS is not recorded
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of this process in bytes, or None
+    where it can not be measured. This is the high-water mark since the
+    process started, not of any one stage.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux gives kilobytes, macOS gives bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def array_bytes(owner):
+    """
+    Returns the total size in bytes of the numpy arrays held as attributes
+    of an object.
+    """
+    if owner is None:
+        return None
+    return sum(value.nbytes for value in vars(owner).values()
+               if isinstance(value, np.ndarray))
+
+
+class Instrument:
+    """
+    Instrument collects timings of each stage of a run. Pass one to
+    Cashflow (or use 'stage' directly around other steps, eg loading the
+    loanbook) and read the results with 'summary'.
+    """
+    def __init__(self, callback=None, months=False):
+        """
+        Initialises an empty set of records.
+
+        Parameters
+        ----------
+        callback : function or logging.Logger, optional
+            Called with a dictionary describing each stage as it finishes
+            (and each month where 'months' is True). A logger is passed a
+            formatted message at INFO level instead.
+            The default is None.
+        months : Boolean, optional
+            True/False value defining whether to time each month of the
+            'numpy' engine calculation loop. The 'fused' engine runs every
+            month in one compiled loop so is only timed as a whole.
+            The default is False.
+
+        Returns
+        -------
+        None.
+        """
+        self.callback = callback
+        self.months = months
+        self.stages = []
+        self.month_times = []
+        self._open = []
+
+    def _emit(self, record):
+        # pass a record to the callback or logger, if one is given
+        if self.callback is None:
+            return
+        if hasattr(self.callback, 'info'):
+            if 'month' in record:
+                self.callback.info(f"month {record['month']}: "
+                                   f"{record['wall']:.6f}s")
+            else:
+                self.callback.info(
+                    f"{record['stage']}: {record['wall']:.3f}s wall, "
+                    f"{record['cpu']:.3f}s cpu" +
+                    ('' if record['process_peak_rss'] is None else
+                     f", process peak RSS "
+                     f"{record['process_peak_rss'] / 2**20:.1f}MB") +
+                    ('' if record['array_bytes'] is None else
+                     f", {record['array_bytes'] / 2**20:.1f}MB arrays"))
+        else:
+            self.callback(record)
+
+    def stage(self, name, owner=None):
+        """
+        Context manager timing a stage. Stages inside other stages are named
+        'outer/inner'.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        owner : object, optional
+            Object whose numpy array attributes are counted before and after
+            the stage to give the array bytes allocated, eg a Cashflow.
+            The default is None.
+
+        Returns
+        -------
+        context manager
+        """
+        return _Stage(self, name, owner)
+
+    def month(self, m, seconds):
+        """
+        Records the time taken by month m of the calculation loop.
+        """
+        self.month_times.append((m, seconds))
+        self._emit({'month': m, 'wall': seconds})
+
+    def summary(self):
+        """
+        Returns the records taken so far.
+
+        Returns
+        -------
+        dictionary
+            Dictionary containing 'stages', a dataframe with one row per
+            stage of 'wall' and 'cpu' seconds, 'process_peak_rss' bytes
+            (the peak of the whole process so far as the stage ends) and
+            'array_bytes' allocated, and 'months', a dataframe of the time
+            of each month of the calculation loop.
+        """
+        return {
+            'stages': pd.DataFrame(
+                self.stages, columns=['stage', 'wall', 'cpu',
+                                      'process_peak_rss', 'array_bytes']),
+            'months': pd.DataFrame(self.month_times,
+                                   columns=['month', 'wall'])
+            }
+
+
+class _Stage:
+    # context manager used by Instrument.stage
+    def __init__(self, instrument, name, owner):
+        self.instrument = instrument
+        self.name = name
+        self.owner = owner
+
+    def __enter__(self):
+        self.instrument._open.append(self.name)
+        self.bytes = array_bytes(self.owner)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *args):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        allocated = array_bytes(self.owner)
+        record = {
+            'stage': '/'.join(self.instrument._open),
+            'wall': wall,
+            'cpu': cpu,
+            'process_peak_rss': peak_rss(),
+            'array_bytes': None if allocated is None \
+                else allocated - self.bytes
+            }
+        self.instrument._open.pop()
+        self.instrument.stages.append(record)
+        self.instrument._emit(record)
+        # keep the summary of the owner up to date
+        if self.owner is not None:
+            self.owner.run_summary = self.instrument.summary()
+
+
+def instrumented(name):
+    """
+    Decorator timing a method as a stage when its object has an
+    Instrument in 'instrument', otherwise the method is called directly.
+    __init__ methods take the Instrument from their 'instrument' argument,
+    whether it is passed by position or keyword.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+        takes_instrument = 'instrument' in signature.parameters
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrument = getattr(self, 'instrument', None)
+            if instrument is None and takes_instrument:
+                try:
+                    instrument = signature.bind_partial(
+                        self, *args, **kwargs).arguments.get('instrument')
+                except TypeError:
+                    # bad arguments, left for the method itself to raise
+                    instrument = None
+            if instrument is None:
+                return method(self, *args, **kwargs)
+            with instrument.stage(name, owner=self):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -16,12 +16,17 @@ visualising data.
 import numpy as np
 import pandas as pd
 import os
+import json
 import math
+import time
+from contextlib import nullcontext
 from datetime import datetime
 import matplotlib.pyplot as plt
 import seaborn as sns
 import formulae as f
 import data as d
+import render as rd
+from instrument import instrumented
 
 
 def month_diff(x, y):
@@ -46,6 +51,44 @@ def month_diff(x, y):
     return (y.year - x.year) * 12 + y.month - x.month
 
 
+def month_index(dates):
+    """
+    Converts dates into integer month numbers (months since January 1970), so
+    that month differences can be taken with simple subtraction.
+
+    Parameters
+    ----------
+    dates : datetime, numpy datetime64 array, or Pandas Series
+        Dates to convert, any day within a month gives the same number.
+
+    Returns
+    -------
+    numpy array or int
+        Month number of each date.
+    """
+    months = np.asarray(dates, dtype='datetime64[M]').astype(np.int64)
+    return months if months.ndim else int(months)
+
+
+def adjustment_date(adjust_str):
+    """
+    Returns the date given by an adjustment column header.
+
+    Parameters
+    ----------
+    adjust_str : str
+        Adjustment column header in format 'adjust %b-%y', for example
+        'adjust Jun-19'.
+
+    Returns
+    -------
+    datetime
+        Datetime of the first day of the adjustment month.
+    """
+    return datetime.strptime(adjust_str.lower().replace('adjust', '').strip(),
+                             '%b-%y')
+
+
 def adjustment_month_diff(adjust_str, start_date):
     """
     Returns to relative month difference between adjust_date and start_date.
@@ -65,14 +108,147 @@ def adjustment_month_diff(adjust_str, start_date):
     """
 
     # convert adjustment column header into datetime
-    adjust_dt = datetime.strptime(adjust_str.lower().replace('adjust', '').strip(),
-                               '%b-%y')
+    adjust_dt = adjustment_date(adjust_str)
 
     # get difference in months between start_date and adjustment date
     return (adjust_dt.year - start_date.year) * 12 + \
             adjust_dt.month - start_date.month
 
 
+def month_cols(array, m):
+    """
+    Returns views of the previous and current month columns of a calculation
+    array. Full arrays hold every month, whereas rolling buffers only hold two
+    columns which alternate between the previous and current month.
+
+    Parameters
+    ----------
+    array : numpy array
+        Calculation array of shape (loans, months) or a (loans, 2) rolling
+        buffer, optionally with leading (eg scenario) axes.
+    m : int
+        Current month index.
+
+    Returns
+    -------
+    previous : numpy array
+        View of the previous month column.
+    current : numpy array
+        View of the current month column.
+    """
+    width = array.shape[-1]
+    return array[..., (m-1) % width], array[..., m % width]
+
+
+def curve_months(curves):
+    """
+    Returns the number of months covered by a formatted CPR or ERC table, or
+    a (table, products) tuple from 'data.load_curves'.
+    """
+    if type(curves) is tuple:
+        return curves[0].shape[1]
+    return curves.shape[1] - 1
+
+
+def curve_lookup(curves, products, m_max, dtype=np.float64):
+    """
+    Normalises a formatted CPR or ERC table into an array of curves, one row
+    per product, and finds the row of each loan's product curve.
+
+    Parameters
+    ----------
+    curves : Pandas DataFrame or tuple
+        Formatted CPR Curves or ERC Lookup data with a 'product' column, or
+        a (table, products) tuple from 'data.load_curves'.
+    products : numpy array
+        Stripped and lowercased product of each loan.
+    m_max : int
+        Number of months each curve must cover.
+    dtype : numpy dtype, optional
+        Floating point precision of the returned curves.
+        The default is np.float64.
+
+    Returns
+    -------
+    table : numpy array
+        Curves array of shape (curve products, m_max).
+    index : numpy array
+        Row of table giving the curve for each loan.
+    """
+
+    if type(curves) is tuple:
+        # already formatted by 'data.load_curves'
+        table, names = curves[0].astype(dtype, copy=False), curves[1]
+    else:
+        names = pd.Index(
+            curves['product'].astype(str).str.strip().str.lower())
+        table = curves.drop(['product'], axis=1).values.astype(dtype)
+    if names.has_duplicates:
+        raise ValueError("Curves contain more than one row for products "
+                         f"{sorted(set(names[names.duplicated()]))}.")
+
+    if table.shape[1] != m_max:
+        raise ValueError(f"Curves cover {table.shape[1]} months but the "
+                         f"cashflow calculation requires {m_max}.")
+
+    # find the curve row for each loan, -1 where the product has no curve
+    index = names.get_indexer(products)
+    if (index == -1).any():
+        raise KeyError("No curve found for products "
+                       f"{sorted(set(products[index == -1]))}.")
+
+    return np.ascontiguousarray(table), index
+
+
+def monthly_eir(loanbook):
+    """
+    Returns the loanbook entity EIR as a monthly rate. Entity EIR is given as
+    an annual rate, so is converted to discount monthly cashflows.
+
+    Parameters
+    ----------
+    loanbook : Pandas DataFrame
+        Formatted loanbook data.
+
+    Returns
+    -------
+    numpy array
+        Monthly entity EIR for each loan, NaN where not given.
+    """
+    if 'entity_eir' not in loanbook.columns:
+        return np.full(len(loanbook), np.nan)
+    annual = loanbook['entity_eir'].values.astype(np.float64)
+    with np.errstate(invalid='ignore'):
+        return (1 + annual) ** (1 / 12) - 1
+
+
+def get_periods(period_start, period_end=None):
+    """
+    Returns reporting periods as a list of (period_start, period_end) tuples.
+
+    Parameters
+    ----------
+    period_start : datetime or list
+        Start date of a single period, or a list of (period_start,
+        period_end) tuples.
+    period_end : datetime, optional
+        End date of a single period.
+
+    Returns
+    -------
+    periods : list
+        List of (period_start, period_end) tuples.
+    single : Boolean
+        True if a single period was given.
+    """
+    if type(period_start) is list:
+        if period_end is not None:
+            raise TypeError("'period_end' must not be given when "
+                            "'period_start' is a list of periods.")
+        return period_start, False
+    return [(period_start, period_end)], True
+
+
 def get_list(out, parameters):
     if out == 'all':
         # if the user wants to visualise all parameters, we build a list
@@ -109,6 +285,63 @@ def get_list(out, parameters):
     # return the list of parameters (strings) and list of arrays
     return parameter_list, array_list
 
+# parameters calculated by Cashflow.calculate_cashflow and selectable through
+# the 'out' lists of Cashflow, 'plot' and 'output'
+PARAMETERS = ['statement interest', 'cumulative amortisation',
+              'cumulative payment', 'scheduled payment', 'early repayment',
+              'early repayment charge', 'cashflow', 'statement amount',
+              'adjustments', 'interest rate']
+
+# Cashflow attribute holding the array for each parameter, profit and loss is
+# used by 'calculate_vals' rather than being selectable for output
+GRIDS = {
+    'statement interest': 'statement_interest',
+    'cumulative amortisation': 'cumulative_amortisation',
+    'cumulative payment': 'cumulative_payment',
+    'scheduled payment': 'scheduled_payment',
+    'early repayment': 'early_repayment',
+    'early repayment charge': 'early_repayment_charge',
+    'cashflow': 'cashflow',
+    'statement amount': 'statement_amount',
+    'adjustments': 'adjustments',
+    'interest rate': 'rate',
+    'profit and loss': 'profit_and_loss'
+    }
+
+# attributes of the arrays written by the month-by-month calculation
+CALCULATED = ['scheduled_payment', 'statement_interest',
+              'cumulative_amortisation', 'cumulative_payment',
+              'early_repayment', 'early_repayment_charge', 'cashflow',
+              'profit_and_loss', 'statement_amount']
+
+# accumulating parameters, always kept at full precision
+ACCUMULATORS = ['cumulative amortisation', 'cumulative payment',
+                'profit and loss']
+
+
+def kept_parameters(out):
+    """
+    Returns the parameters kept for every month for a Cashflow 'out' list.
+
+    Parameters
+    ----------
+    out : list or str
+        List of parameter names, as for 'get_list', or 'all'.
+
+    Returns
+    -------
+    list
+        List of parameter names to keep. 'all' also keeps profit and loss,
+        and the cashflow is always kept as it is needed for EIR, NPV and P&L.
+    """
+    if out == 'all':
+        return PARAMETERS + ['profit and loss']
+    keep, _ = get_list(out, {param: None for param in PARAMETERS})
+    if 'cashflow' not in keep:
+        keep.append('cashflow')
+    return keep
+
+
 class Cashflow:
     """
     Class used to control cashflow calculation. This contains calculations in
@@ -116,7 +349,10 @@ class Cashflow:
     Before this is run the Loanbook, CPR Curves, and ERC Lookup tables must
     have all been formatted into the correct formats using the data script.
     """
-    def __init__(self, loanbook, erc_lookup):
+    @instrumented('Cashflow.__init__')
+    def __init__(self, loanbook, erc_lookup, engine='numpy', out='all',
+                 dtype=np.float64, cache=None, run_dir=None,
+                 instrument=None):
         """
         Initialises key parameters and arrays for cashflow calculation
 
@@ -124,8 +360,48 @@ class Cashflow:
         ----------
         loanbook : Pandas DataFrame
             Formatted loanbook data.
-        erc_lookup : Pandas DataFrame
-            Formatted ERC Lookup data.
+        erc_lookup : Pandas DataFrame or tuple
+            Formatted ERC Lookup data, or a (table, products) tuple from
+            'data.load_curves'.
+        engine : str, optional
+            Calculation engine used by 'calculate_cashflow'. Options include:<br>
+            - 'numpy': calculates all loans together month-by-month         <br>
+            - 'fused': runs the whole recurrence loan-by-loan in a single
+               compiled loop, in parallel across cores (requires numba,
+               otherwise falls back to 'numpy')                             <br>
+            The default is 'numpy'.
+        out : list, optional
+            List of parameter names (as used by 'plot' and 'output') to keep
+            for every month. Other calculated parameters are kept as rolling
+            buffers holding only the last two months, which saves memory when
+            only a few parameters are needed. The interest rate and
+            adjustments arrays are only built when requested, otherwise
+            each month's values are found from per loan vectors. The
+            cashflow is always kept as it is needed for EIR, NPV and P&L.
+            The default is 'all'.
+        dtype : numpy dtype, optional
+            Floating point precision of the calculation arrays, eg np.float32
+            to halve memory use. Cumulative amortisation, cumulative payment,
+            and profit and loss always accumulate in np.float64. Use 'drift'
+            to compare results against a np.float64 run.
+            The default is np.float64.
+        cache : ResultCache, optional
+            On-disk result cache (see the cache script). Loans found in the
+            cache are not calculated by 'calculate_cashflow', their results
+            and EIR are read from the cache instead, and newly calculated
+            loans are added to it.
+            The default is None.
+        run_dir : str, optional
+            Directory in which to back every (loans, months) array with a
+            .npy file using np.memmap, so the calculation writes straight to
+            disk and loanbooks larger than memory can be calculated. The
+            results can be reopened later without recalculating using
+            'open_run'. Files already in the directory are overwritten.
+            The default is None (arrays held in memory).
+        instrument : Instrument, optional
+            Instrument (see the instrument script) recording the time and
+            memory of each stage of this object, with the results kept in
+            'run_summary'. The default is None (no instrumentation).
         period_start : datetime
             Datetime object giving the month and year of the period start used
             in NPV calculations.
@@ -139,122 +415,236 @@ class Cashflow:
 
         """
 
+        # check the calculation engine is one we recognise
+        if engine not in ('numpy', 'fused'):
+            raise ValueError(f"'{engine}' is not a valid engine, use either "
+                             "'numpy' or 'fused'.\n"
+                             "See 'Cashflow' in 'documentation/calculation' "
+                             "for more information.")
+        if engine == 'fused' and not f.NUMBA:
+            print("Warning: numba is not installed so the 'fused' engine is "
+                  "unavailable, defaulting to the 'numpy' engine.")
+            engine = 'numpy'
+        self.engine = engine
+        self.instrument = instrument
+        self.run_summary = None
+
+        # check the precision is a floating point type
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != 'f':
+            raise TypeError(f"'dtype' must be a floating point type, not "
+                            f"'{self.dtype}'.")
+
         # get number of loans (needed for array shape)
-        loans = loanbook.values.shape[0]
+        loans = len(loanbook)
         # get maximum number of months (needed for array shape...
-        self.m_max = erc_lookup.shape[1] - 1  # ...and calculation loop)
+        self.m_max = curve_months(erc_lookup)  # ...and calculation loop)
 
         # get list of all products
         self.products = loanbook['product'].str.strip().str.lower().values
-        # initialise empty array for new erc_lookup format
-        self.erc_lookup = np.zeros((loans, self.m_max))
-
-        for i in range(loans):
-            # build new erc_lookup array where rows match to rows in loanbook
-            self.erc_lookup[i, :] = erc_lookup.drop(['product'], axis=1)[
-                erc_lookup['product'].str.strip().str.lower() \
-                    == self.products[i]
-                ].values
+        # normalise the erc_lookup table once into an array of curves and
+        # store the row of each loan's product curve, rather than a copy of
+        # the curve for every loan
+        with self._stage('curve_lookup'):
+            self.erc_curves, self.erc_index = curve_lookup(
+                erc_lookup, self.products, self.m_max, self.dtype)
+
+        # find which parameters we keep for every month, the rest only need
+        # a two month rolling buffer as the calculation only ever reads the
+        # previous and current month
+        self.out = out
+        self.keep = kept_parameters(out)
+
+        # if run directory does not already exist, make it
+        self.run_dir = run_dir
+        if run_dir is not None and not os.path.isdir(run_dir):
+            os.makedirs(run_dir)
+
+        def array(name, columns, dtype):
+            # full arrays are backed by a .npy file in the run directory when
+            # one is given, rolling buffers always stay in memory
+            if run_dir is not None and columns == self.m_max:
+                return np.lib.format.open_memmap(
+                    os.path.join(run_dir, f"{name}.npy"), mode='w+',
+                    dtype=dtype, shape=(loans, columns))
+            return np.zeros((loans, columns), dtype=dtype)
+
+        def grid(param):
+            # build a full array or rolling buffer depending on self.keep,
+            # accumulating parameters are always kept at full precision
+            return array(GRIDS[param],
+                         self.m_max if param in self.keep else 2,
+                         np.float64 if param in ACCUMULATORS else self.dtype)
 
         # initialise all calculation arrays as zeros
         # we will then iterate over each array calculate month-by-month
-        self.early_repayment = np.zeros((loans, self.m_max))  # epmt
-        self.scheduled_payment = np.zeros((loans, self.m_max))  # spmt
-        self.statement_interest = np.zeros((loans, self.m_max))  # sint
-        self.cumulative_amortisation = np.zeros((loans, self.m_max))  # cam
-        self.cumulative_payment = np.zeros((loans, self.m_max))  # cpy
+        self.early_repayment = grid('early repayment')  # epmt
+        self.scheduled_payment = grid('scheduled payment')  # spmt
+        self.statement_interest = grid('statement interest')  # sint
+        self.cumulative_amortisation = grid('cumulative amortisation')  # cam
+        self.cumulative_payment = grid('cumulative payment')  # cpy
         #self.net_present_value = np.zeros((loans, self.m_max))  # npv
-        self.profit_and_loss = np.zeros((loans, self.m_max))  #pls
-        self.cashflow = np.zeros((loans, self.m_max))  # cashflow
-        self.early_repayment_charge = np.zeros((loans, self.m_max))  # erc
-        self.statement_amount = np.zeros((loans, self.m_max))  # cstmt / ostmt
+        self.profit_and_loss = grid('profit and loss')  #pls
+        self.cashflow = grid('cashflow')  # cashflow
+        self.early_repayment_charge = grid('early repayment charge')  # erc
+        self.statement_amount = grid('statement amount')  # cstmt / ostmt
 
         # some values we already know, so now we input these into our arrays
         # initial statement amount in month 0 is simply the loan_amount
         self.statement_amount[:, 0] = loanbook['loan_amount'].values.T
 
-        # initialise adjustments and interest rate arrays with zeros
-        self.adjustments = np.zeros((loans, self.m_max))
-        self.rate = np.zeros((loans, self.m_max))
-        # for the adjustments array, we must enter the adjustment amount in the
-        # correct month (column) and correct loan (row), so first we build a
-        # list of tuples in the format: (loan, month, amount)
-        adjust = []
-        # at the same time, we will build up our rate array row-by-row, this
-        # is necessary as each loan (row) may have different reversion dates,
-        # now we get the reversion months array
-        self.reversion = np.array(
-            [month_diff(loanbook.iloc[i]['origination_date'],
-                        loanbook.iloc[i]['reversion_date']) \
-             for i in range(len(loanbook))]
-            )
-        # now we iterate through each loan product
-        for i in range(loans):
-            # pull out a specific loan
-            loan = loanbook.iloc[i]
-
-            # find adjustment columns
-            adjust_amounts = [loan[col] for col in loan.index \
-                              if 'adjust' in col.lower()]
-            
-            # if there are adjustment columns, add (loan, month, amount)
-            # tuple to list
-            if len(adjust_amounts) > 0:
-                adjust.extend(
-                    [(i,
-                      adjustment_month_diff(col, loan['origination_date']),
-                      loan[col]) \
-                     for col in loan.index if 'adjust' in col.lower()]
-                    )
-            # run through rate logic and additions to array
-            if self.reversion[i] < self.m_max:
-                # build Initial Rate array
-                init_rate = np.array(
-                    [loan['initial_rate']]*self.reversion[i]
-                    )
-                # build Reversion Rate array
-                rev_rate = np.array(
-                    [loan['reversion_rate']]*(self.m_max-self.reversion[i])
-                    )
-                # concatenate initial rate and reversion rates along column axis
-                self.rate[i, :] = np.concatenate((init_rate, rev_rate))
-            else:
-                # just initial rate throughout so build full array with this value
-                self.rate[i, :] = np.array(
-                    [loanbook.iloc[i]['initial_rate']]*self.m_max
-                    ).T
-        # the adjustments array can now be built using the adjust tuple list
-        for i, month, amount in adjust:
-            self.adjustments[i, month] = amount
-
-        # initialise initial costs, fees and loan amount arrays
-        self.upfront_costs = np.zeros((loans, self.m_max))
-        self.upfront_fees = np.zeros((loans, self.m_max))
-        self.loan_amount = np.zeros((loans, self.m_max))
-
-        # initial costs/fees only occur in month 0
-        self.upfront_costs[:, 0] = loanbook['upfront_costs'].values.T
-        self.upfront_fees[:, 0] = loanbook['upfront_fees'].values.T
-        self.loan_amount[:, 0] = loanbook['loan_amount'].values.T
+        # find the per loan inputs of the calculation (origination and
+        # reversion months, rates, adjustments and upfront amounts)
+        ignored = self._loan_inputs(loanbook)
+        if ignored != 0:
+            print(f"Warning: {ignored} adjustments fall outside of the "
+                  "calculated months and have been ignored.")
+
+        self.rate = None
+        if 'interest rate' in self.keep:
+            # the rate array is only built when requested, comparing a month
+            # index against the reversion month of every loan at once
+            months = np.arange(self.m_max)
+            self.rate = array('rate', self.m_max, self.dtype)
+            self.rate[:] = self.reversion_rate[:, np.newaxis]
+            np.copyto(self.rate, self.initial_rate[:, np.newaxis],
+                      where=months[np.newaxis, :] < \
+                          self.reversion[:, np.newaxis])
+
+        # the adjustments array is also only built when requested
+        self.adjustments = None
+        if 'adjustments' in self.keep:
+            self.adjustments = array('adjustments', self.m_max, self.dtype)
+            self.adjustments[self.adjust_loan, self.adjust_month] = \
+                self.adjust_amount
 
         # keep loanbook in object for outputting to file in 'output' method
         self.loanbook = loanbook
+        # keep the erc lookup table for fingerprinting loans in the cache
+        self.erc_lookup = erc_lookup
+        self.cache = cache
+        self.cached_eir = None
 
         # define our parameter mapping dictionary, mapping user given strings
-        # to arrays calculated by calculate_cashflow
+        # to arrays calculated by calculate_cashflow, only parameters kept for
+        # every month can be plotted or output
         self.parameter_mapping = {
-            'statement interest': self.statement_interest,
-            'cumulative amortisation': self.cumulative_amortisation,
-            'cumulative payment': self.cumulative_payment,
-            'scheduled payment': self.scheduled_payment,
-            'early repayment': self.early_repayment,
-            'early repayment charge': self.early_repayment_charge,
-            'cashflow': self.cashflow,
-            'statement amount': self.statement_amount,
-            'adjustments': self.adjustments,
-            'interest rate': self.rate
+            param: getattr(self, GRIDS[param])
+            for param in PARAMETERS if param in self.keep
             }
 
+        if run_dir is not None:
+            # record which loans and arrays are in the run directory so the
+            # run can be reopened by 'open_run'
+            np.save(os.path.join(run_dir, 'loan_id.npy'),
+                    loanbook['loan_id'].to_numpy().astype('U'))
+            np.save(os.path.join(run_dir, 'product.npy'),
+                    np.asarray(self.products, dtype='U'))
+            arrays = [name for name, value in vars(self).items()
+                      if isinstance(value, np.memmap)]
+            with open(os.path.join(run_dir, 'run.json'), 'w') as fp:
+                json.dump({'loans': loans, 'm_max': self.m_max,
+                           'dtype': self.dtype.str, 'keep': self.keep,
+                           'arrays': sorted(arrays)}, fp, indent=4)
+
+    def _loan_inputs(self, loanbook):
+        """
+        Sets the per loan inputs of the calculation from the loanbook, with
+        'dtype' and 'm_max' already set.
+
+        Parameters
+        ----------
+        loanbook : Pandas DataFrame
+            Formatted loanbook data.
+
+        Returns
+        -------
+        int
+            Number of non-zero adjustments falling outside of the calculated
+            months, which are ignored.
+        """
+        loans = len(loanbook)
+
+        # keep the origination month number of each loan, all relative month
+        # calculations (reversion, adjustments, reporting periods) use this
+        self.origination = month_index(loanbook['origination_date'])
+
+        # now we get the reversion months array, each loan (row) may have
+        # different reversion dates
+        self.reversion = month_index(loanbook['reversion_date']) - \
+            self.origination
+
+        # each loan's rate is its initial rate in months before reversion and
+        # its reversion rate from then on, so the rate of any month can be
+        # found from these two vectors (see '_month_rate')
+        self.initial_rate = loanbook['initial_rate'].values.astype(self.dtype)
+        self.reversion_rate = \
+            loanbook['reversion_rate'].values.astype(self.dtype)
+
+        # for the adjustments we find the month (column) and loan (row) of
+        # every adjustment amount, each adjustment column header gives a
+        # single date so we parse it once per column
+        rows, cols, amounts = [], [], []
+        for col in [col for col in loanbook.columns if 'adjust' in col.lower()]:
+            # relative month of the adjustment for every loan
+            month = month_index(adjustment_date(col)) - self.origination
+            rows.append(np.arange(loans))
+            cols.append(month)
+            # amounts may be read in as strings, so we convert them to
+            # numbers before comparing or placing them
+            amounts.append(loanbook[col].to_numpy(dtype=np.float64))
+
+        ignored = 0
+        if len(rows) > 0:
+            rows, cols = np.concatenate(rows), np.concatenate(cols)
+            amounts = np.concatenate(amounts)
+            # adjustments dated before origination or beyond the final month
+            # have no month to go in
+            inside = (cols >= 0) & (cols < self.m_max)
+            ignored = int((~inside & (amounts != 0)).sum())
+            rows, cols = rows[inside], cols[inside]
+            amounts = amounts[inside].astype(self.dtype)
+            # where a loan has several adjustments in one month the last
+            # column is used, the rest are dropped leaving one entry per
+            # loan and month sorted by loan then month
+            cell = rows * self.m_max + cols
+            _, last = np.unique(cell[::-1], return_index=True)
+            last = len(cell) - 1 - last
+            rows, cols, amounts = rows[last], cols[last], amounts[last]
+        else:
+            rows = cols = np.zeros(0, dtype=np.int64)
+            amounts = np.zeros(0, dtype=self.dtype)
+
+        # the adjustments are kept as these (loan, month, amount) entries,
+        # with the first entry of each loan in 'adjust_start'
+        self.adjust_loan, self.adjust_month = rows, cols
+        self.adjust_amount = amounts
+        self.adjust_start = np.searchsorted(rows, np.arange(loans + 1))
+
+        # initial costs/fees and loan amount only occur in month 0, so these
+        # are kept as a single value per loan
+        self.upfront_costs = \
+            loanbook['upfront_costs'].values.astype(self.dtype)
+        self.upfront_fees = loanbook['upfront_fees'].values.astype(self.dtype)
+        self.loan_amount = loanbook['loan_amount'].values.astype(self.dtype)
+
+        # monthly entity EIR used for entity NPV
+        self.entity_eir = monthly_eir(loanbook)
+        return ignored
+
+    def _month_rate(self, m):
+        # interest rate of every loan in month m
+        return np.where(m < self.reversion, self.initial_rate,
+                        self.reversion_rate)
+
+    def _stage(self, name):
+        # time a stage when instrumented, otherwise do nothing
+        instrument = getattr(self, 'instrument', None)
+        if instrument is None:
+            return nullcontext()
+        return instrument.stage(name, owner=self)
+
+    @instrumented('calculate_cashflow')
     def calculate_cashflow(self, cpr):
         """
         Method used to run the calculations. This will iteratively calculate
@@ -262,6 +652,45 @@ class Cashflow:
         amortisation and payment, early repayment charges, cashflow, and
         profit and loss; month-by-month.
 
+        Parameters
+        ----------
+        cpr : Pandas DataFrame or tuple
+            Formatted CPR Curves data, or a (table, products) tuple from
+            'data.load_curves'.
+
+        Returns
+        -------
+        None.
+
+        """
+        # normalise the cpr table into an array of curves, with the row of
+        # each loan's product curve
+        with self._stage('curve_lookup'):
+            self.cpr_curves, self.cpr_index = curve_lookup(
+                cpr, self.products, self.m_max, self.dtype)
+        self.cached_eir = None
+
+        if self.cache is not None:
+            self._calculate_cached(cpr)
+        else:
+            with self._stage('month_loop'):
+                self._recurrence(
+                    self.cpr_curves, self.cpr_index,
+                    self.erc_curves, self.erc_index,
+                    {attr: getattr(self, attr) for attr in CALCULATED})
+
+        # write any disk backed results out to the run directory
+        if self.run_dir is not None:
+            for attr in CALCULATED:
+                if isinstance(getattr(self, attr), np.memmap):
+                    getattr(self, attr).flush()
+
+    def _calculate_cached(self, cpr):
+        """
+        Calculates only the loans missing from the result cache, taking the
+        calculated arrays and EIR of every other loan from the cache. Hit and
+        miss counts for this run are stored in 'cache_stats'.
+
         Parameters
         ----------
         cpr : Pandas DataFrame
@@ -272,165 +701,779 @@ class Cashflow:
         None.
 
         """
-        # initialise empty array for new cpr curves format
-        self.cpr = np.zeros((self.erc_lookup.shape[0], self.m_max))
+        # key each loan on its inputs, calculation precision and engine
+        keys = [f"{key:016x}" for key in
+                fingerprint(self.loanbook, self.erc_lookup, cpr,
+                            self.dtype, self.engine)]
+        # only arrays kept for every month are cached
+        attrs = [attr for attr in CALCULATED
+                 if getattr(self, attr).shape[1] == self.m_max]
+        found = self.cache.get(keys, attrs, self.m_max)
+
+        loans = len(keys)
+        eir = np.full(loans, np.nan)
+        converged = np.zeros(loans, dtype=bool)
+        iterations = np.zeros(loans, dtype=np.int64)
+
+        # fill in the cache hits
+        hits = np.fromiter(found, dtype=np.int64, count=len(found))
+        if len(hits) > 0:
+            rows = np.stack([found[i][0] for i in hits])
+            for j, attr in enumerate(attrs):
+                getattr(self, attr)[hits] = rows[:, j]
+            eir[hits] = [found[i][1] for i in hits]
+            converged[hits] = [found[i][2] for i in hits]
+            iterations[hits] = [found[i][3] for i in hits]
+
+        # calculate the misses without the cache, then add them to it
+        missed = np.ones(loans, dtype=bool)
+        missed[hits] = False
+        if missed.any():
+            update = Cashflow(self.loanbook[missed].reset_index(drop=True),
+                              self.erc_lookup, engine=self.engine,
+                              out=self.out, dtype=self.dtype)
+            update.calculate_cashflow(cpr)
+            for attr in attrs:
+                getattr(self, attr)[missed] = getattr(update, attr)
+            (eir[missed], converged[missed],
+             iterations[missed]) = f.irr(update.cashflow[:, :-1],
+                                         guess=update.eir_guess())
+            self.cache.put([key for key, miss in zip(keys, missed) if miss],
+                           attrs,
+                           np.stack([getattr(update, attr) for attr in attrs],
+                                    axis=1),
+                           eir[missed], converged[missed], iterations[missed])
+            del update
+
+        # the EIR is reused by 'calculate_vals' rather than solved again
+        self.cached_eir = (eir, converged, iterations)
+        self.cache_stats = {'hits': len(hits), 'misses': int(missed.sum())}
+
+
+    def _recurrence(self, cpr_curves, cpr_index, erc_curves, erc_index, grids):
+        """
+        Runs the month-by-month cashflow calculation, writing into the given
+        result arrays. These may have a leading scenario axis, shape
+        (scenarios, loans, months), in which case the CPR and ERC curves
+        passed must have the same leading axis.
+
+        Parameters
+        ----------
+        cpr_curves : numpy array
+            CPR curves array, shape ([scenarios,] products, months).
+        cpr_index : numpy array
+            Row of 'cpr_curves' giving the CPR curve of each loan.
+        erc_curves : numpy array
+            ERC lookup curves array, shape ([scenarios,] products, months).
+        erc_index : numpy array
+            Row of 'erc_curves' giving the ERC curve of each loan.
+        grids : dictionary
+            Dictionary of {attribute name: numpy array} for each calculated
+            array (see CALCULATED), full arrays or rolling buffers.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.engine == 'fused':
+            if grids['cashflow'].ndim == 3:
+                # the fused kernel runs one scenario at a time
+                for s in range(grids['cashflow'].shape[0]):
+                    self._recurrence(
+                        cpr_curves[s] if cpr_curves.ndim == 3 else cpr_curves,
+                        cpr_index,
+                        erc_curves[s] if erc_curves.ndim == 3 else erc_curves,
+                        erc_index,
+                        {attr: grids[attr][s] for attr in grids})
+                return
 
-        for i in range(len(self.products)):
-            # build new cpr array where rows match to rows in loanbook
-            self.cpr[i, :] = cpr.drop(['product'], axis=1)[
-                cpr['product'].str.strip().str.lower() \
-                    == self.products[i]
-                ].values
+            # the fused engine runs every month for each loan in one loop
+            f.fused_cashflow(
+                self.loan_amount,
+                self.upfront_costs,
+                self.upfront_fees,
+                self.reversion,
+                self.loanbook['monthly_repay_io'].values,
+                self.loanbook['monthly_repay'].values,
+                self.loanbook['monthly_repay_reversion'].values,
+                self.loanbook['monthly_repay_io_reversion'].values,
+                self.initial_rate, self.reversion_rate,
+                cpr_curves, cpr_index, erc_curves, erc_index,
+                self.adjust_start, self.adjust_month, self.adjust_amount,
+                grids['scheduled_payment'], grids['statement_interest'],
+                grids['cumulative_amortisation'], grids['cumulative_payment'],
+                grids['early_repayment'], grids['early_repayment_charge'],
+                grids['cashflow'], grids['profit_and_loss'],
+                grids['statement_amount']
+                )
+            return
 
         # we calculate values for all loans month-by-month
         # for most calculations we will use a mix of previous month values
-        # [:, m-1] and current month values [:, m]
+        # [:, m-1] and current month values [:, m], for series only kept as
+        # rolling buffers these are whichever of the two columns hold them
+        cpr_month = cpr_curves[..., cpr_index, 0]
+        # adjustments ordered by month, those of month m are the entries
+        # by_month[month_start[m]:month_start[m+1]]
+        by_month = np.argsort(self.adjust_month, kind='stable')
+        month_start = np.searchsorted(self.adjust_month[by_month],
+                                      np.arange(self.m_max + 1))
+        adjustments = np.zeros(len(self.products), dtype=self.dtype)
+        # each month is only timed when the instrument asks for it
+        instrument = getattr(self, 'instrument', None)
+        timed = instrument is not None and instrument.months
         for m in range(1, self.m_max):
-            # here we use vectorised implementation of scheduled_payment
-            # calculation from formulae.py
-            self.scheduled_payment[:, m] = f.v_scheduled_payment(
+            if timed:
+                start = time.perf_counter()
+            # gather this month's CPR and ERC % for each loan from its curve
+            cpr_prev, cpr_month = cpr_month, cpr_curves[..., cpr_index, m]
+            erc_month = erc_curves[..., erc_index, m]
+            # and scatter this month's adjustments into a single column
+            adjustments[:] = 0
+            entries = by_month[month_start[m]:month_start[m+1]]
+            adjustments[self.adjust_loan[entries]] = \
+                self.adjust_amount[entries]
+
+            spmt_prev, spmt = month_cols(grids['scheduled_payment'], m)
+            sint_prev, sint = month_cols(grids['statement_interest'], m)
+            cam_prev, cam = month_cols(grids['cumulative_amortisation'], m)
+            cpy_prev, cpy = month_cols(grids['cumulative_payment'], m)
+            epmt_prev, epmt = month_cols(grids['early_repayment'], m)
+            erc = month_cols(grids['early_repayment_charge'], m)[1]
+            cashflow = month_cols(grids['cashflow'], m)[1]
+            pls_prev, pls = month_cols(grids['profit_and_loss'], m)
+            ostmt, cstmt = month_cols(grids['statement_amount'], m)
+
+            # here we use the array implementation of scheduled_payment
+            # calculation from formulae.py, writing straight into this month
+            f.v_scheduled_payment(
                 m,
-                self.loan_amount[:, 0],
+                self.loan_amount,
                 self.reversion,
-                self.cumulative_payment[:, m-1],
-                self.statement_amount[:, m-1],
-                self.early_repayment[:, m-1],
-                self.scheduled_payment[:, m-1],
+                cpy_prev,
+                ostmt,
+                epmt_prev,
+                spmt_prev,
                 self.loanbook['monthly_repay_io'].values,
                 self.loanbook['monthly_repay'].values,
                 self.loanbook['monthly_repay_reversion'].values,
-                self.loanbook['monthly_repay_io_reversion'].values
+                self.loanbook['monthly_repay_io_reversion'].values,
+                out=spmt
                 )
 
             # here we calculate the monthly statement interest, which is:
             # current month interest rate * previous month statement amount
             # (eg current month opening balance) and divide by 12 as we are
             # using annual interest rate to calculate monthly increase
-            self.statement_interest[:, m] = self.rate[:, m] * \
-                self.statement_amount[:, m-1] / 12
+            sint[:] = self._month_rate(m) * ostmt / 12
 
             # here we calculate the total amortisation upto this current month
             # this is just the sum of the previous month's [statement
             # interest, scheduled payment, and cumulative amortisation]
-            self.cumulative_amortisation[:, m] = \
-                self.statement_interest[:, m-1] + \
-                self.scheduled_payment[:, m-1] + \
-                self.cumulative_amortisation[:, m-1]
+            cam[:] = sint_prev + spmt_prev + cam_prev
 
             # cumulative payment is (initial Loan Amount + current amortisation)
             # multiplied by the difference in current and previous months CPR
             # (eg the % amount of the loan paid off this month according to
             # CPR curves), previous cumulative payment is also added
-            self.cumulative_payment[:, m] = f.cum_prepayment(
-                self.cumulative_payment[:, m-1],
-                self.loan_amount[:, 0],
-                self.cumulative_amortisation[:, m],
-                self.cpr[:, m],
-                self.cpr[:, m-1]
+            cpy[:] = f.cum_prepayment(
+                cpy_prev,
+                self.loan_amount,
+                cam,
+                cpr_month,
+                cpr_prev
                 )
 
-            # early repayment is calculated using the vectorised implementation
+            # early repayment is calculated using the array implementation
             # of the early_repayment calculation from formulae.py
-            self.early_repayment[:, m] = f.v_early_repayment(
-                self.statement_amount[:, m-1],
-                self.statement_interest[:, m],
-                self.scheduled_payment[:, m],
-                self.cumulative_payment[:, m-1],
-                self.cumulative_payment[:, m]
+            f.v_early_repayment(
+                ostmt,
+                sint,
+                spmt,
+                cpy_prev,
+                cpy,
+                out=epmt
                 )
 
             # the erc is calculated as this month's early repayment amount
             # multiplied by this months ERC % given by the erc_lookup table
-            self.early_repayment_charge[:, m] = self.erc_lookup[:, m] * self.early_repayment[:, m]
+            erc[:] = erc_month * epmt
 
             # this month's cashflow is simply the sum of all previous month's
             # payments [scheduled_payment, early_repayment] + thiis month's
             # charges and adjustments [early_repayment_charge, adjustments]
-            # note: loan_amount, upfront_costs, and upfront_fees only contain
-            # amounts in month 0, and thus make no impact after the first month
-            self.cashflow[:, m] = f.cashflow_calc(
-                self.loan_amount[:, m-1],
-                self.upfront_costs[:, m-1],
-                self.upfront_fees[:, m-1],
-                self.scheduled_payment[:, m-1],
-                self.early_repayment[:, m-1],
-                self.early_repayment_charge[:, m],
-                self.adjustments[:, m]
+            # note: loan_amount, upfront_costs, and upfront_fees only occur in
+            # month 0, and thus make no impact after the first month
+            cashflow[:] = f.cashflow_calc(
+                self.loan_amount if m == 1 else 0,
+                self.upfront_costs if m == 1 else 0,
+                self.upfront_fees if m == 1 else 0,
+                spmt_prev,
+                epmt_prev,
+                erc,
+                adjustments
                 )
 
             # cumulative profit and loss is simply previous month P&L - current
             # month cashflow
-            self.profit_and_loss[:, m] = self.profit_and_loss[:, m-1] - self.cashflow[:, m]
+            pls[:] = pls_prev - cashflow
 
             # statement amount is simply the sum of the previous month's
             # statement amount and the current month's [statement_interest,
             # scheduled_payment, early_repayment]
-            self.statement_amount[:, m] = \
-                self.statement_amount[:, m-1] + \
-                self.statement_interest[:, m] + \
-                self.scheduled_payment[:, m] + \
-                self.early_repayment[:, m]
+            cstmt[:] = ostmt + sint + spmt + epmt
+
+            if timed:
+                instrument.month(m, time.perf_counter() - start)
 
 
-    def calculate_vals(self, period_start, period_end):
+    @instrumented('calculate_vals')
+    def calculate_vals(self, period_start, period_end=None, eir=None):
         """
         Used for calculating effective interest rate, net present value, and
         profit and loss for cashflows calculated with the cashflow method.
+        The EIR is calculated once, after which any number of reporting
+        periods can be valued from running totals of the discounted cashflows
+        and profit and loss.
         
         Parameters
         ----------
-        period_start : datetime
-            Start date for NPV and P&L calculations.
-        peiod_end : datetime
-            End date for P&L calculation.
+        period_start : datetime or list
+            Start date for NPV and P&L calculations, or a list of
+            (period_start, period_end) tuples to value several reporting
+            periods in one call.
+        period_end : datetime, optional
+            End date for P&L calculation, not needed if 'period_start' is a
+            list of periods.
+        eir : tuple, optional
+            Previously calculated (eir, converged, iterations) arrays to reuse
+            rather than solving for the EIR again.
+            The default is None.
         
         Returns
         -------
         None.
+        
+        Notes
+        -----
+        The EIR of each loan is stored in 'eir', with 'eir_converged' flagging
+        loans where a rate was found (NaN otherwise, for example where the
+        cashflows never change sign) and 'eir_iterations' giving the number of
+        solver iterations used.
+
+        For a single period 'npv' and 'pl' hold one value per loan, for a list
+        of periods they hold arrays of shape (loans, periods). In both cases
+        'vals' holds a tidy dataframe with one row per loan and period.
+        """
+
+        # check whether we have been given one or many reporting periods
+        periods, single = get_periods(period_start, period_end)
+        self.periods = periods
+
+        # loans read from the result cache already have their EIR
+        if eir is None:
+            eir = getattr(self, 'cached_eir', None)
+
+        (self.eir, self.eir_converged, self.eir_iterations, self.npv,
+         self.pl, self.vals) = self._values(self.cashflow,
+                                            self.profit_and_loss, periods,
+                                            eir=eir)
+
+        if single:
+            # a single period gives a single value per loan
+            self.npv = {key: self.npv[key][:, 0] for key in self.npv}
+            self.pl = self.pl[:, 0]
+
+
+    def _values(self, cashflow, profit_and_loss, periods, tidy=True,
+                eir=None):
+        """
+        Calculates the EIR of each loan, and the NPV and P&L of each loan for
+        every reporting period, from a cashflow array.
+
+        Parameters
+        ----------
+        cashflow : numpy array
+            Cashflow array of shape (loans, months).
+        profit_and_loss : numpy array
+            Profit and loss array of shape (loans, months), if None or only a
+            rolling buffer this is rebuilt from the cashflow.
+        periods : list
+            List of (period_start, period_end) tuples.
+        tidy : Boolean, optional
+            True/False value defining whether to build the tidy 'vals'
+            dataframe, otherwise None is returned in its place.
+            The default is True.
+        eir : tuple, optional
+            Previously calculated (eir, converged, iterations) arrays to reuse.
+            The default is None.
+
+        Returns
+        -------
+        eir : numpy array
+            Calculated EIR of each loan.
+        converged : numpy array
+            Boolean array, True where an EIR was found.
+        iterations : numpy array
+            Number of EIR solver iterations used for each loan.
+        npv : dictionary
+            Dictionary of 'calculated' and 'entity' NPV arrays, each of shape
+            (loans, periods).
+        pl : numpy array
+            P&L array of shape (loans, periods).
+        vals : Pandas DataFrame
+            Tidy dataframe with one row per loan and period.
         """
         
-        # intialise EIR, NPV, and P&L lists
-        self.eir = []
-        self.npv = {}
-        self.npv['calculated'] = []
-        self.npv['entity'] = []
-        self.pl = []
-
-        # loop through each loan and calculate values
-        for i in range(self.cashflow.shape[0]):
+        # calculate the EIR for every loan at once, this is the internal rate
+        # of return of the cashflows as we have already taken into account
+        # interest, adjustments etc - :-1 gives us the final cashflow values
+        # only as we have calculated cumulative cashflow
+        if eir is None:
+            with self._stage('irr'):
+                eir, converged, iterations = f.irr(cashflow[:, :-1],
+                                                   guess=self.eir_guess())
+        else:
+            eir, converged, iterations = eir
+
+        # profit and loss is the negative running total of the cashflow, so
+        # it can be rebuilt if it was only kept as a rolling buffer
+        if profit_and_loss is None or profit_and_loss.shape[1] != self.m_max:
+            profit_and_loss = -np.cumsum(cashflow, axis=1)
+
+        # running total of profit and loss, so the sum over months
+        # [start, end) is simply pl_total[end] - pl_total[start]
+        pl_total = np.zeros((profit_and_loss.shape[0], self.m_max + 1))
+        np.cumsum(profit_and_loss, axis=1, out=pl_total[:, 1:])
+
+        # discounted cashflows from each month to the end of the loan for
+        # each rate, the NPV at any period_start is then a single lookup
+        rates = {'calculated': eir, 'entity': self.entity_eir}
+        discounted = {key: f.discounted_total(rates[key], cashflow)
+                      for key in rates}
+
+        loans = np.arange(cashflow.shape[0])
+        npv = {key: [] for key in rates}
+        pl = []
+        for start_date, end_date in periods:
             # we need to know the relative months for the portfolio
             # period_start and period_end for each loan based on the loan's
-            # origination_date
-            start = month_diff(
-                    self.loanbook.iloc[i]['origination_date'],
-                    period_start
-                    )
-            end = month_diff(
-                    self.loanbook.iloc[i]['origination_date'],
-                    period_end
-                    )
-            
-            # we only want cashflows occuring after the period_start for NPV
-            npv_cashflow = [0.] + self.cashflow[i, start:]
-
-            # calculate the EIR, we use the numpy IRR function which gives
-            # us EIR as we have already taken into account interest, adjustments
-            # etc - :-1 gives us the final cashflow values only as we have
-            # calculated cumulative cashflow
-            self.eir.append(np.irr(self.cashflow[i, :-1]))
-
-            # we calculate the NPV with our own calculated EIR
-            self.npv['calculated'].append(-np.npv(self.eir[i], npv_cashflow))
-            # we calculate entity NPV using given loanbook EIR values
-            self.npv['entity'].append(-np.npv(self.entity_eir[i], npv_cashflow))
-
-            # finally, take sum of profit_and_loss per loan
-            self.pl.append(sum(self.profit_and_loss[i, start:end]))
+            # origination_date, limited to the months we have calculated
+            start = month_index(start_date) - self.origination
+            end = month_index(end_date) - self.origination
+            first = np.clip(start, 0, self.m_max)
+
+            # we only want cashflows occuring after the period_start for NPV,
+            # discounted back to the period_start (as np.npv, the cashflow in
+            # the period_start month itself is not discounted)
+            for key in rates:
+                with np.errstate(over='ignore', invalid='ignore'):
+                    growth = np.exp(np.log1p(rates[key]) * start)
+                npv[key].append(-growth * discounted[key][loans, first])
+
+            # take sum of profit_and_loss per loan within the period
+            pl.append(pl_total[loans, np.clip(end, first, self.m_max)] -
+                      pl_total[loans, first])
+
+        # stack the values for each period as columns
+        npv = {key: np.stack(npv[key], axis=1) for key in npv}
+        pl = np.stack(pl, axis=1)
+
+        if not tidy:
+            return eir, converged, iterations, npv, pl, None
+
+        # build the tidy loan x period dataframe
+        vals = pd.DataFrame({
+            'loan_id': np.tile(self.loanbook['loan_id'].values, len(periods)),
+            'period_start': np.repeat([p[0] for p in periods], len(loans)),
+            'period_end': np.repeat([p[1] for p in periods], len(loans)),
+            'calculated_eir': np.tile(eir, len(periods)),
+            'calculated_npv': npv['calculated'].ravel(order='F'),
+            'entity_npv': npv['entity'].ravel(order='F'),
+            'calculated_profit_and_loss': pl.ravel(order='F')
+            })
+
+        return eir, converged, iterations, npv, pl, vals
+
+
+    def _scenario_batch_size(self, memory):
+        """
+        Number of scenarios whose arrays fit in 'memory' bytes, at least one
+        (see '_scenario_memory').
+        """
+        per_scenario, valuation = self._scenario_memory()
+        return int(max(1, (memory - valuation) // per_scenario))
+
+
+    def _scenario_memory(self):
+        """
+        Bytes of the arrays allocated by 'calculate_scenarios' and 'simulate'
+        for a batch of scenarios.
+
+        Returns
+        -------
+        per_scenario : int
+            Bytes used by each scenario of a batch.
+        valuation : int
+            Bytes used while valuing a scenario, which happens one scenario
+            at a time so does not depend on the batch size.
+        """
+        loans, months = len(self.products), self.m_max
+        products = len(np.unique(self.products))
+        accumulators = [GRIDS[param] for param in ACCUMULATORS]
+
+        # the calculated arrays of '_scenario_grids', the cashflow is kept for
+        # every month and the other arrays as two month rolling buffers
+        grids = sum(
+            loans * (months if attr == 'cashflow' else 2) *
+            (8 if attr in accumulators else self.dtype.itemsize)
+            for attr in CALCULATED)
+        # the CPR and ERC curves of each scenario, each held twice while
+        # they are stacked (or, for 'simulate', shocked and cast)
+        curves = 2 * 2 * products * months * 8
+        # each month of '_recurrence' works on columns of (loans,) values:
+        # this and the previous month's CPR %, this month's ERC %, and the
+        # temporaries of the longest calculation (cumulative prepayment)
+        columns = (3 + 4) * loans * 8
+        per_scenario = grids + curves + columns
+
+        # '_values' holds the profit and loss, its running total, and a
+        # discounted total for each of the two rates, plus the discount
+        # factors, their exponent, and the discounted cashflows of the rate
+        # being worked on, each of shape (loans, months + 1) at most - the
+        # EIR solver before these holds no more than three such arrays
+        full = loans * (months + 1) * 8
+        valuation = (2 + 2 + 3) * full
+
+        return per_scenario, valuation
+
+
+    def _scenario_grids(self, scenarios):
+        """
+        Initialises the calculated arrays for a batch of scenarios, with the
+        cashflow kept for every month and the other arrays as rolling
+        buffers.
+
+        Parameters
+        ----------
+        scenarios : int
+            Number of scenarios in the batch.
+
+        Returns
+        -------
+        grids : dictionary
+            Dictionary of {attribute name: numpy array}, each of shape
+            (scenarios, loans, months or 2).
+        """
+        loans = len(self.products)
+        accumulators = [GRIDS[param] for param in ACCUMULATORS]
+        grids = {
+            attr: np.zeros(
+                (scenarios, loans, self.m_max if attr == 'cashflow' else 2),
+                dtype=np.float64 if attr in accumulators else self.dtype)
+            for attr in CALCULATED
+            }
+        # initial statement amount in month 0 is simply the loan_amount
+        grids['statement_amount'][..., 0] = self.loan_amount
+        return grids
+
+
+    @instrumented('calculate_scenarios')
+    def calculate_scenarios(self, cpr, period_start, period_end=None,
+                            erc_lookup=None, batch_size=None, memory=2**30):
+        """
+        Calculates EIR, NPV and P&L for the loanbook under many CPR (and
+        optionally ERC) curve sets. Scenarios are calculated together along
+        a leading scenario axis, sharing the loan-level inputs (rates,
+        reversion, adjustments) built in initialisation. Only the cashflow is
+        kept for every month, and scenarios are run in batches so that the
+        cashflow arrays fit in 'memory'.
+
+        Parameters
+        ----------
+        cpr : list or dictionary
+            List of formatted CPR Curves tables, or dictionary of
+            {scenario name: formatted CPR Curves table}.
+        period_start : datetime or list
+            Start date for NPV and P&L calculations, or a list of
+            (period_start, period_end) tuples as for 'calculate_vals'.
+        period_end : datetime, optional
+            End date for P&L calculation.
+        erc_lookup : list or dictionary, optional
+            Formatted ERC Lookup tables matching each CPR scenario. If not
+            given, the ERC Lookup given at initialisation is used throughout.
+            The default is None.
+        batch_size : int, optional
+            Number of scenarios calculated together. If not given, this is
+            found from 'memory'.
+            The default is None.
+        memory : int, optional
+            Approximate number of bytes the scenario arrays may use, used to
+            find the batch size.
+            The default is 2**30 (1 GiB).
+
+        Returns
+        -------
+        Pandas DataFrame
+            Tidy dataframe with one row per scenario, loan and period, also
+            kept as 'scenario_vals'.
+        """
+
+        periods, _ = get_periods(period_start, period_end)
+
+        # scenario names and tables
+        if type(cpr) is dict:
+            names, cpr = list(cpr), list(cpr.values())
+        else:
+            names = list(range(len(cpr)))
+        if erc_lookup is not None:
+            erc_lookup = list(erc_lookup.values()) \
+                if type(erc_lookup) is dict else list(erc_lookup)
+            if len(erc_lookup) != len(cpr):
+                raise ValueError("There must be one ERC Lookup table for "
+                                 "each CPR scenario.")
+
+        # curves are stacked with one row per loanbook product, so every
+        # scenario shares the same loan to curve index
+        products, index = np.unique(self.products, return_inverse=True)
+
+        def stack(tables):
+            # stack the curves of each table, ordered as products
+            curves = []
+            for table in tables:
+                table, rows = curve_lookup(table, products, self.m_max,
+                                           self.dtype)
+                curves.append(table[rows])
+            return np.stack(curves)
+
+        if batch_size is None:
+            batch_size = self._scenario_batch_size(memory)
+
+        frames = []
+        for first in range(0, len(cpr), batch_size):
+            batch = range(first, min(first + batch_size, len(cpr)))
+
+            grids = self._scenario_grids(len(batch))
+            cpr_curves = stack([cpr[s] for s in batch])
+            if erc_lookup is None:
+                erc_curves, erc_index = self.erc_curves, self.erc_index
+            else:
+                erc_curves = stack([erc_lookup[s] for s in batch])
+                erc_index = index
+
+            self._recurrence(cpr_curves, index, erc_curves, erc_index, grids)
+
+            # value each scenario of the batch
+            for i, s in enumerate(batch):
+                vals = self._values(grids['cashflow'][i], None, periods)[-1]
+                vals.insert(0, 'scenario', names[s])
+                frames.append(vals)
+            del grids, cpr_curves
+
+        self.scenario_vals = pd.concat(frames, ignore_index=True)
+        return self.scenario_vals
+
+
+    @instrumented('simulate')
+    def simulate(self, cpr, period_start, period_end=None, paths=1000,
+                 shock='multiplicative', volatility=0.1, seed=None,
+                 percentiles=(5, 50, 95), batch_size=None, memory=2**30):
+        """
+        Monte Carlo simulation of prepayment. Each path scales the speed of
+        prepayment of every product's CPR curve by a random factor, and all
+        paths are pushed through the cashflow calculation in batches along a
+        scenario axis. Only running totals are kept between batches, so
+        memory does not grow with the number of paths.
+
+        Shocks are drawn per path and product from a standard normal Z:   <br>
+        - 'multiplicative': the prepaid fraction 1 - cpr is scaled by
+           exp(volatility * Z - volatility^2 / 2), which averages 1      <br>
+        - 'logistic': the curve is shifted on the logit scale,
+           cpr = 1 / (1 + exp(-(logit(cpr) - volatility * Z)))            <br>
+
+        Parameters
+        ----------
+        cpr : Pandas DataFrame
+            Formatted CPR Curves data giving the base curves.
+        period_start : datetime or list
+            Start date for NPV and P&L calculations, or a list of
+            (period_start, period_end) tuples as for 'calculate_vals'.
+        period_end : datetime, optional
+            End date for P&L calculation.
+        paths : int, optional
+            Number of simulated paths.
+            The default is 1000.
+        shock : str, optional
+            Type of shock, either 'multiplicative' or 'logistic'.
+            The default is 'multiplicative'.
+        volatility : float, optional
+            Standard deviation of the shocks.
+            The default is 0.1.
+        seed : int, optional
+            Seed of the random number generator.
+            The default is None.
+        percentiles : tuple, optional
+            Percentiles of the portfolio totals to report.
+            The default is (5, 50, 95).
+        batch_size : int, optional
+            Number of paths calculated together. If not given, this is found
+            from 'memory'.
+            The default is None.
+        memory : int, optional
+            Approximate number of bytes the path arrays may use, used to
+            find the batch size.
+            The default is 2**30 (1 GiB).
+
+        Returns
+        -------
+        Pandas DataFrame
+            Summary of the portfolio total NPV (calculated and entity) and
+            P&L for each period, giving the mean, standard deviation, and
+            percentiles across paths. This is also kept in
+            simulation['portfolio'], with the mean and standard deviation of
+            each loan's values across paths in simulation['loans'].
+        """
+
+        if shock not in ('multiplicative', 'logistic'):
+            raise ValueError(f"'{shock}' is not a valid shock, use either "
+                             "'multiplicative' or 'logistic'.")
+        periods, _ = get_periods(period_start, period_end)
+        if batch_size is None:
+            batch_size = self._scenario_batch_size(memory)
+
+        # base curves with one row per loanbook product
+        products, index = np.unique(self.products, return_inverse=True)
+        base, rows = curve_lookup(cpr, products, self.m_max, np.float64)
+        base = base[rows]
+
+        # draw every shock up front so results do not depend on batch size
+        rng = np.random.default_rng(seed)
+        shocks = rng.standard_normal((paths, len(products)))
+
+        measures = ['calculated_npv', 'entity_npv',
+                    'calculated_profit_and_loss']
+        # portfolio totals of every path are small enough to keep
+        totals = {key: np.zeros((paths, len(periods))) for key in measures}
+        # loan-level running sums for the mean and standard deviation
+        loans = len(self.products)
+        sums = {key: np.zeros((loans, len(periods))) for key in measures}
+        squares = {key: np.zeros((loans, len(periods))) for key in measures}
+
+        for first in range(0, paths, batch_size):
+            batch = range(first, min(first + batch_size, paths))
+            z = shocks[batch.start:batch.stop, :, np.newaxis]
+
+            # perturb the base curves for each path
+            if shock == 'multiplicative':
+                factor = np.exp(volatility * z - volatility ** 2 / 2)
+                cpr_curves = np.clip(1 - (1 - base) * factor, 0, 1)
+            else:
+                with np.errstate(divide='ignore'):
+                    logit = np.log(base) - np.log1p(-base)
+                cpr_curves = 1 / (1 + np.exp(-(logit - volatility * z)))
+            cpr_curves = cpr_curves.astype(self.dtype)
+
+            grids = self._scenario_grids(len(batch))
+            self._recurrence(cpr_curves, index, self.erc_curves,
+                             self.erc_index, grids)
+
+            for i, path in enumerate(batch):
+                _, _, _, npv, pl, _ = self._values(grids['cashflow'][i], None,
+                                                   periods, tidy=False)
+                values = {'calculated_npv': npv['calculated'],
+                          'entity_npv': npv['entity'],
+                          'calculated_profit_and_loss': pl}
+                for key in measures:
+                    totals[key][path] = np.nansum(values[key], axis=0)
+                    sums[key] += values[key]
+                    squares[key] += values[key] ** 2
+            del grids, cpr_curves
+
+        # summarise portfolio totals across paths
+        portfolio = []
+        for key in measures:
+            for j, (start_date, end_date) in enumerate(periods):
+                summary = {'measure': key, 'period_start': start_date,
+                           'period_end': end_date,
+                           'mean': totals[key][:, j].mean(),
+                           'std': totals[key][:, j].std()}
+                for q in percentiles:
+                    summary[f"p{q}"] = np.percentile(totals[key][:, j], q)
+                portfolio.append(summary)
+
+        # loan-level mean and standard deviation across paths
+        loan_summary = pd.DataFrame({
+            'loan_id': np.tile(self.loanbook['loan_id'].values, len(periods)),
+            'period_start': np.repeat([p[0] for p in periods], loans),
+            'period_end': np.repeat([p[1] for p in periods], loans)
+            })
+        for key in measures:
+            mean = sums[key] / paths
+            std = np.sqrt(np.maximum(squares[key] / paths - mean ** 2, 0))
+            loan_summary[f"{key}_mean"] = mean.ravel(order='F')
+            loan_summary[f"{key}_std"] = std.ravel(order='F')
+
+        self.simulation = {'portfolio': pd.DataFrame(portfolio),
+                           'loans': loan_summary}
+        return self.simulation['portfolio']
+
+
+    def eir_guess(self):
+        """
+        Starting point for the EIR solver in 'calculate_vals', taken from the
+        annual 'entity_eir' loanbook column converted to a monthly rate.
+
+        Returns
+        -------
+        numpy array or None
+            Monthly rate for each loan, None if there is no 'entity_eir'
+            column or it is empty.
+        """
+        if np.isnan(self.entity_eir).all():
+            return None
+        return self.entity_eir
+
+
+    def drift(self, reference):
+        """
+        Compares calculated arrays against a reference calculation, typically
+        a np.float64 run on the same data used to check a lower precision run.
+
+        Parameters
+        ----------
+        reference : Cashflow
+            Calculated Cashflow object to compare against.
+
+        Returns
+        -------
+        drift : dictionary
+            Maximum absolute difference for each parameter kept in both
+            Cashflow objects, and for the 'profit and loss' array.
+        """
+
+        drift = {
+            param: float(np.max(np.abs(
+                self.parameter_mapping[param].astype(np.float64) -
+                reference.parameter_mapping[param]
+                ), initial=0))
+            for param in self.parameter_mapping
+            if param in reference.parameter_mapping
+            }
+
+        # profit and loss is compared where both runs kept it in full
+        if self.profit_and_loss is not None and \
+                reference.profit_and_loss is not None and \
+                self.profit_and_loss.shape == reference.profit_and_loss.shape:
+            drift['profit and loss'] = float(np.max(np.abs(
+                self.profit_and_loss - reference.profit_and_loss), initial=0))
+
+        return drift
 
 
     def plot(self, products='all', out='all',
              save=False, path='./Outputs/Cashflow/Visualisation',
-             limit=30):
+             limit=30, format='jpg', processes=None):
         """
         Method for plotting key parameters onto a Matplotlib subplots object.
         These key parameters are the arrays used during the cashflow calculation.
@@ -462,6 +1505,18 @@ class Cashflow:
             If the 'save' parameter is True then the number of visualisations
             to be saved to file will be limited by this parameter.
             The default is 30.
+        format : str, optional
+            File format used when 'save' is True. Options include:          <br>
+            - 'jpg': saves up to 'limit' figures one at a time               <br>
+            - 'png': saves a figure for every loan, rendered headless across
+               a pool of processes (see the render script)                  <br>
+            - 'pdf': as 'png', but saves a multi-page PDF per product with a
+               page per loan, large products are only split across the
+               pool where pypdf is installed to merge the pages             <br>
+            The default is 'jpg'.
+        processes : int, optional
+            Number of processes used for 'png' and 'pdf' rendering.
+            The default is None (one per core).
 
         Returns
         -------
@@ -479,9 +1534,9 @@ class Cashflow:
 
         if products == 'all':
             # if all products chosen, we do not need to select specific rows
+            row_idx = np.arange(len(self.loanbook))
             products = (self.loanbook['loan_id'].astype(str) +
                         self.loanbook['product'].astype(str)).values
-            pass
         elif type(products) is list:
             # strip whitespace and lowercase all entries in products list
             products = [str(prod).strip().lower() for prod in products]
@@ -508,6 +1563,14 @@ class Cashflow:
                             "See 'plot' in 'documentation/calculation/Cashflow' "
                             "for more information.")
 
+        if save and format != 'jpg':
+            # render every selected loan headless, in parallel
+            rd.render_loans(
+                plot_list, parameter_list, products,
+                self.loanbook['product'].astype(str).values[row_idx], path,
+                format=format, processes=processes)
+            return
+
         # we do some calculations to find optimal width and height of subplot
         width = sorted([(len(plot_list) % x, x) for x in range(2, 7)])[0][1]
         height = math.ceil(len(plot_list) / width)
@@ -536,7 +1599,7 @@ class Cashflow:
                 if height == 1:
                     axes = ax[x]
                 else:
-                    axes = ax[x, y]
+                    axes = ax[y, x]
 
                 # plot the parameter array
                 axes.plot(range(len(data_dict[param])), data_dict[param],
@@ -578,12 +1641,14 @@ class Cashflow:
                 return
 
 
+    @instrumented('output')
     def output(self, path="./Outputs/Cashflow", preappend="", vis=False,
-               out='all', loanbook=False):
+               out='all', loanbook=False, append=False, format='csv',
+               layout='wide', compression='zstd', chunk_size=10000):
         """
         Method to output cashflow, calculated arrays, and loanbook with
-        calculated EIR, NPV and P&L columns to CSV. Can also output array
-        lineplots with 'vis' parameter.
+        calculated EIR, NPV and P&L columns to CSV, Parquet or Arrow. Can
+        also output array lineplots with 'vis' parameter.
 
         Parameters
         ----------
@@ -614,6 +1679,29 @@ class Cashflow:
             True/False indicating whether to output input loanbook data with
             additional columnsfor calculated EIR, NPV, entity NPV, and P&L.
             The Default is False.
+        append : Boolean, optional
+            True/False value defining whether to add rows to the end of
+            existing output files rather than overwrite them, used when
+            outputting a loanbook in chunks. Parquet and Arrow files are
+            written as numbered parts instead (see 'data.TableWriter').
+            The default is False.
+        format : str, optional
+            Output file format. Options include:                            <br>
+            - 'csv': pipe delimited CSV of the cashflow array and loanbook   <br>
+            - 'parquet': Parquet file for every array in 'out', and the
+               loanbook (requires pyarrow)                                  <br>
+            - 'arrow': Arrow IPC file for every array in 'out', and the
+               loanbook (requires pyarrow)                                  <br>
+            The default is 'csv'.
+        layout : str, optional
+            Layout of Parquet/Arrow arrays, either 'wide' (a row per loan and
+            a column per month) or 'long' (a row per loan and month).
+            The default is 'wide'.
+        compression : str, optional
+            Parquet/Arrow compression codec. The default is 'zstd'.
+        chunk_size : int, optional
+            Number of loans in each Parquet row group/Arrow record batch.
+            The default is 10000.
 
         Returns
         -------
@@ -621,6 +1709,13 @@ class Cashflow:
 
         """
 
+        if format != 'csv':
+            self._output_columnar(path, preappend, out, append, format,
+                                  layout, compression, chunk_size)
+            if vis:
+                self.plot(save=True, path=os.path.join(path, "Visualisation"))
+            return
+
         # we will output key tables, all will need loan product to be added
         # and to be converted into Pandas DataFrames
 
@@ -632,24 +1727,344 @@ class Cashflow:
                               ignore_index=True,
                               axis=1)
         # save to file
-        d.output(cashflows, path=path, file=f"{preappend}cashflows")
+        d.output(cashflows, path=path, file=f"{preappend}cashflows",
+                 append=append)
         del cashflows
 
-        # create loanbook with new calculated columns
-        loanbook = pd.concat([self.loanbook, pd.DataFrame({
-            'calculated_eir': self.eir,
-            'calculated_npv': self.npv['Calculated'],
-            'entity_npv': self.npv['Entity'],
-            'calculated_profit_and_loss': self.pl
-            })],
+        # create loanbook with new calculated columns, where several periods
+        # were valued the NPV and P&L are output separately, one row per loan
+        # and period
+        if self.pl.ndim == 1:
+            calculated = pd.DataFrame({
+                'calculated_eir': self.eir,
+                'calculated_npv': self.npv['calculated'],
+                'entity_npv': self.npv['entity'],
+                'calculated_profit_and_loss': self.pl
+                })
+        else:
+            calculated = pd.DataFrame({'calculated_eir': self.eir})
+            d.output(self.vals, path=path, file=f"{preappend}values",
+                     append=append)
+        loanbook = pd.concat([self.loanbook, calculated],
                              ignore_index=True,
                              axis=1)
 
         # save to file
-        d.output(loanbook, path=path, file=f"{preappend}loanbook")
+        d.output(loanbook, path=path, file=f"{preappend}loanbook",
+                 append=append)
         del loanbook
 
         if vis:
             self.plot(save=True, path=os.path.join(path, "Visualisation"))
 
+    def _output_columnar(self, path, preappend, out, append, format, layout,
+                         compression, chunk_size):
+        """
+        Streams the arrays in 'out', the loanbook with calculated EIR, NPV and
+        P&L columns, and (for several periods) the tidy values to Parquet or
+        Arrow files, 'chunk_size' loans at a time. See 'output' for
+        parameters.
+        """
+        if chunk_size < 1:
+            raise ValueError("'chunk_size' must be a positive integer.")
+        loans = len(self.loanbook)
+        loan_id = self.loanbook['loan_id'].to_numpy()
+        products = np.asarray(self.products, dtype=str)
+
+        # one file per array, converting each chunk of loans straight from
+        # the array rather than through a DataFrame
+        parameters, arrays = get_list(out, self.parameter_mapping)
+        for param, array in zip(parameters, arrays):
+            with d.TableWriter(path, f"{preappend}{GRIDS[param]}", format,
+                               compression, append) as writer:
+                for first in range(0, loans, chunk_size):
+                    rows = slice(first, first + chunk_size)
+                    writer.write(d.grid_table(array[rows], loan_id[rows],
+                                              products[rows], GRIDS[param],
+                                              layout))
+
+        # loanbook with new calculated columns, where several periods were
+        # valued the NPV and P&L are output separately
+        if self.pl.ndim == 1:
+            calculated = {
+                'calculated_eir': self.eir,
+                'calculated_npv': self.npv['calculated'],
+                'entity_npv': self.npv['entity'],
+                'calculated_profit_and_loss': self.pl
+                }
+        else:
+            calculated = {'calculated_eir': self.eir}
+            with d.TableWriter(path, f"{preappend}values", format,
+                               compression, append) as writer:
+                for first in range(0, len(self.vals),
+                                   chunk_size * len(self.periods)):
+                    writer.write(self.vals.iloc[
+                        first:first + chunk_size * len(self.periods)])
+
+        loanbook = self.loanbook.reset_index(drop=True).assign(**calculated)
+        with d.TableWriter(path, f"{preappend}loanbook", format, compression,
+                           append) as writer:
+            for first in range(0, loans, chunk_size):
+                writer.write(loanbook.iloc[first:first + chunk_size])
+
     # class end
+
+
+def run_chunked(loanbook, erc_lookup, cpr, period_start, period_end,
+                chunk_size=10000, sink=None, path="./Outputs/Cashflow",
+                preappend="", **kwargs):
+    """
+    Runs the cashflow model over a large loanbook in slices of loans. Each
+    slice is initialised, calculated, and valued as its own Cashflow object,
+    passed to the output sink and then freed, so peak memory depends on
+    'chunk_size' rather than the size of the loanbook.
+
+    Parameters
+    ----------
+    loanbook : Pandas DataFrame
+        Formatted loanbook data.
+    erc_lookup : Pandas DataFrame
+        Formatted ERC Lookup data.
+    cpr : Pandas DataFrame
+        Formatted CPR Curves data.
+    period_start : datetime
+        Start date for NPV and P&L calculations.
+    period_end : datetime
+        End date for P&L calculation.
+    chunk_size : int, optional
+        Number of loans calculated in each slice.
+        The default is 10000.
+    sink : function, optional
+        Function called as sink(cashflow, chunk) with the calculated Cashflow
+        object and chunk number of each slice. If not given, each slice is
+        appended to the cashflows and loanbook CSVs in 'path' using
+        'Cashflow.output'.
+    path : str, optional
+        Output path used by the default sink.
+        The default is "./Outputs/Cashflow".
+    preappend : str, optional
+        Text to preappend to the filenames saved by the default sink.
+        The default is "".
+    **kwargs
+        Additional keyword arguments passed to Cashflow, eg 'engine'.
+
+    Returns
+    -------
+    chunks : int
+        Number of slices calculated.
+
+    """
+
+    if chunk_size < 1:
+        raise ValueError("'chunk_size' must be a positive integer.")
+
+    if sink is None:
+        # by default we append each slice's results to the same output files
+        def sink(cashflow, chunk):
+            cashflow.output(path=path, preappend=preappend,
+                            append=chunk > 0)
+
+    chunks = 0
+    for start in range(0, len(loanbook), chunk_size):
+        # take a slice of loans, resetting the index so each slice is
+        # indexed from zero like a full loanbook
+        chunk = loanbook.iloc[start:start+chunk_size].reset_index(drop=True)
+
+        cashflow = Cashflow(chunk, erc_lookup, **kwargs)
+        cashflow.calculate_cashflow(cpr)
+        cashflow.calculate_vals(period_start, period_end)
+
+        # pass results on and free the slice before building the next
+        sink(cashflow, chunks)
+        del cashflow, chunk
+        chunks += 1
+
+    return chunks
+
+
+def fingerprint(loanbook, erc_lookup, cpr, dtype=np.float64,
+                engine='numpy'):
+    """
+    Returns a hash of the inputs of each loan: its formatted loanbook row
+    (including adjustment columns), its product's CPR and ERC curves, and the
+    precision and engine it is calculated with. Loans with the same
+    fingerprint give the same calculated results.
+
+    Parameters
+    ----------
+    loanbook : Pandas DataFrame
+        Formatted loanbook data.
+    erc_lookup : Pandas DataFrame
+        Formatted ERC Lookup data.
+    cpr : Pandas DataFrame
+        Formatted CPR Curves data.
+    dtype : numpy dtype, optional
+        Floating point precision of the calculation.
+        The default is np.float64.
+    engine : str, optional
+        Calculation engine, 'numpy' or 'fused'.
+        The default is 'numpy'.
+
+    Returns
+    -------
+    numpy array
+        Unsigned 64-bit integer hash for each loan.
+    """
+    products = loanbook['product'].str.strip().str.lower().values
+    m_max = curve_months(erc_lookup)
+
+    # hash each curve once and look up the hash of each loan's curve
+    curve_hashes = []
+    for curves in (cpr, erc_lookup):
+        table, index = curve_lookup(curves, products, m_max)
+        curve_hashes.append(pd.util.hash_pandas_object(
+            pd.DataFrame(table), index=False).values[index])
+
+    rows = pd.util.hash_pandas_object(loanbook, index=False).values
+    return pd.util.hash_pandas_object(pd.DataFrame({
+        'row': rows, 'cpr': curve_hashes[0], 'erc': curve_hashes[1],
+        'dtype': np.dtype(dtype).str, 'engine': engine
+        }), index=False).values
+
+
+def run_incremental(previous, loanbook, erc_lookup, cpr, period_start,
+                    period_end=None, verbose=True, **kwargs):
+    """
+    Calculates a loanbook reusing the results of a previous run. Each loan's
+    inputs are fingerprinted, and only loans which are new or whose
+    fingerprint has changed are calculated. All other loans take their
+    calculated arrays and EIR from the previous run, matched on loan_id. NPV
+    and P&L are then valued for every loan from the merged cashflows.
+
+    Parameters
+    ----------
+    previous : Cashflow or None
+        Cashflow returned by a previous 'run_incremental' call, or None to
+        calculate every loan.
+    loanbook : Pandas DataFrame
+        Formatted loanbook data.
+    erc_lookup : Pandas DataFrame
+        Formatted ERC Lookup data.
+    cpr : Pandas DataFrame
+        Formatted CPR Curves data.
+    period_start : datetime or list
+        Start date for NPV and P&L calculations, or a list of
+        (period_start, period_end) tuples as for 'calculate_vals'.
+    period_end : datetime, optional
+        End date for P&L calculation.
+    verbose : Boolean, optional
+        True/False indicating whether to print the number of loans reused
+        and recalculated.
+        The default is True.
+    **kwargs
+        Additional keyword arguments passed to Cashflow, eg 'engine'. The
+        'out' parameters of a previous run are always used.
+
+    Returns
+    -------
+    Cashflow
+        Calculated and valued Cashflow object, with the loan fingerprints in
+        'fingerprints' and counts in 'incremental' as a dictionary of
+        {'reused': int, 'recomputed': int}.
+
+    """
+
+    loanbook = loanbook.reset_index(drop=True)
+    if previous is not None:
+        kwargs['out'] = previous.out
+
+    # initialise the full cashflow, results are filled in below
+    result = Cashflow(loanbook, erc_lookup, **kwargs)
+    prints = fingerprint(loanbook, erc_lookup, cpr,
+                         result.dtype, result.engine)
+    result.cpr_curves, result.cpr_index = curve_lookup(
+        cpr, result.products, result.m_max, result.dtype)
+    result.fingerprints = prints
+
+    # find loans whose inputs have not changed since the previous run
+    reuse = np.zeros(len(loanbook), dtype=bool)
+    if previous is not None and previous.m_max == result.m_max and \
+            hasattr(previous, 'fingerprints') and hasattr(previous, 'eir'):
+        previous_ids = pd.Index(previous.loanbook['loan_id'].astype(str))
+        if previous_ids.has_duplicates:
+            raise ValueError("The previous run contains duplicate loan_id "
+                             "values, so loans cannot be matched.")
+        position = previous_ids.get_indexer(loanbook['loan_id'].astype(str))
+        found = position >= 0
+        reuse[found] = previous.fingerprints[position[found]] == prints[found]
+        position = position[reuse]
+    changed = ~reuse
+
+    # calculate the new and changed loans only
+    eir = np.full(len(loanbook), np.nan)
+    converged = np.zeros(len(loanbook), dtype=bool)
+    iterations = np.zeros(len(loanbook), dtype=np.int64)
+    if changed.any():
+        update = Cashflow(loanbook[changed].reset_index(drop=True),
+                          erc_lookup, **kwargs)
+        update.calculate_cashflow(cpr)
+        for attr in CALCULATED:
+            if getattr(update, attr).shape[1] == update.m_max:
+                getattr(result, attr)[changed] = getattr(update, attr)
+        (eir[changed], converged[changed],
+         iterations[changed]) = f.irr(update.cashflow[:, :-1],
+                                      guess=update.eir_guess())
+        del update
+
+    # and take the rest from the previous run
+    if reuse.any():
+        for attr in CALCULATED:
+            if getattr(result, attr).shape[1] == result.m_max:
+                getattr(result, attr)[reuse] = \
+                    getattr(previous, attr)[position]
+        eir[reuse] = previous.eir[position]
+        converged[reuse] = previous.eir_converged[position]
+        iterations[reuse] = previous.eir_iterations[position]
+
+    result.calculate_vals(period_start, period_end,
+                          eir=(eir, converged, iterations))
+
+    result.incremental = {'reused': int(reuse.sum()),
+                          'recomputed': int(changed.sum())}
+    if verbose:
+        print(f"{result.incremental['reused']} loans reused and "
+              f"{result.incremental['recomputed']} loans recalculated.")
+
+    return result
+
+
+def open_run(run_dir, mode='r'):
+    """
+    Opens the arrays of a Cashflow calculated with 'run_dir', memory mapping
+    each .npy file so no data is read until it is used.
+
+    Parameters
+    ----------
+    run_dir : str
+        Run directory given to Cashflow.
+    mode : str, optional
+        Memory map mode, 'r' for read-only or 'r+' to allow changes to be
+        written back to the files.
+        The default is 'r'.
+
+    Returns
+    -------
+    dictionary
+        Dictionary of {name: numpy array} containing 'loan_id' and 'product'
+        for each row, and every (loans, months) array of the run, eg
+        'cashflow' or 'statement_amount'.
+
+    """
+    with open(os.path.join(run_dir, 'run.json')) as fp:
+        run = json.load(fp)
+
+    arrays = {name: np.load(os.path.join(run_dir, f"{name}.npy"))
+              for name in ('loan_id', 'product')}
+    for name in run['arrays']:
+        arrays[name] = np.load(os.path.join(run_dir, f"{name}.npy"),
+                               mmap_mode=mode)
+        if arrays[name].shape != (run['loans'], run['m_max']):
+            raise ValueError(f"'{name}.npy' in '{run_dir}' does not match "
+                             "the shape of the run, it may have been "
+                             "overwritten by another run.")
+    return arrays
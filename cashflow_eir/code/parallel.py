@@ -0,0 +1,237 @@
+"""
+Parallel
+
+Developers:
+James Briggs
+
+Description:
+Script used to run the cashflow model across several processes. The loanbook
+is split into shards of loans, each worker calculates its shards and writes
+the rows straight into result arrays held in shared memory, so no results
+are sent back between processes.
+"""
+
+import os
+import numpy as np
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+import model as mo
+
+
+# inputs shared with each worker process by the pool initialiser
+_inputs = {}
+
+
+def _init_worker(loanbook, erc_lookup, cpr, kwargs):
+    # keep the inputs in the worker so they are only sent once per process
+    _inputs.update(loanbook=loanbook, erc_lookup=erc_lookup, cpr=cpr,
+                   kwargs=kwargs)
+
+
+class _SharedBuffer(np.ndarray):
+    # array over a SharedMemory block, holding the block so its memory stays
+    # mapped for as long as this array, or any array viewing it, exists
+    pass
+
+
+def _shared_array(shm, shape, dtype):
+    """
+    Returns a numpy array over a SharedMemory block. The array is a view of
+    a '_SharedBuffer' holding the block, so the block is only closed once
+    every array using its memory has been deleted.
+    """
+    owner = _SharedBuffer(shape, dtype=dtype, buffer=shm.buf)
+    owner.shm = shm
+    return owner.view(np.ndarray)
+
+
+def _run_shard(shard):
+    """
+    Calculates the cashflows for one shard of loans and writes each result
+    array into its rows of the shared memory arrays.
+
+    Parameters
+    ----------
+    shard : tuple
+        Tuple in format (start, stop, chunk_size, arrays) where arrays is a
+        dictionary of {parameter: (shared memory name, shape, dtype)}.
+
+    Returns
+    -------
+    int
+        Number of loans calculated.
+    """
+    start, stop, chunk_size, arrays = shard
+
+    # attach to the shared result arrays
+    shared = {param: SharedMemory(name=arrays[param][0]) for param in arrays}
+    grids = {
+        param: np.ndarray(arrays[param][1], dtype=arrays[param][2],
+                          buffer=shared[param].buf)
+        for param in arrays
+        }
+
+    # calculate the shard in chunks to bound the worker's own memory
+    for first in range(start, stop, chunk_size):
+        last = min(first + chunk_size, stop)
+        loans = _inputs['loanbook'].iloc[first:last].reset_index(drop=True)
+        cashflow = mo.Cashflow(loans, _inputs['erc_lookup'],
+                               **_inputs['kwargs'])
+        cashflow.calculate_cashflow(_inputs['cpr'])
+        for param in grids:
+            grids[param][first:last] = getattr(cashflow, mo.GRIDS[param])
+        del cashflow, loans
+
+    # release our views before detaching from the shared memory
+    del grids
+    for shm in shared.values():
+        shm.close()
+
+    return stop - start
+
+
+class SharedCashflow(mo.Cashflow):
+    """
+    Cashflow calculated in parallel by 'run_parallel'. The result arrays are
+    held in shared memory, which stays mapped for as long as any of the
+    arrays (or views of them) exist. Every method other than
+    'calculate_cashflow' works as it does for Cashflow, eg 'calculate_vals',
+    'calculate_scenarios', 'plot', and 'output'. Parameters that were not
+    kept are set to None.
+    """
+    def __init__(self, loanbook, erc_lookup, m_max, out, grids, engine,
+                 dtype):
+        """
+        Initialises the object around the shared result arrays.
+
+        Parameters
+        ----------
+        loanbook : Pandas DataFrame
+            Formatted loanbook data.
+        erc_lookup : Pandas DataFrame
+            Formatted ERC Lookup data.
+        m_max : int
+            Number of months calculated.
+        out : list
+            Parameters kept for every month, as given to 'run_parallel'.
+        grids : dictionary
+            Dictionary of {parameter: numpy array} result arrays.
+        engine : str
+            Calculation engine used by the workers.
+        dtype : numpy dtype
+            Floating point precision of the calculation arrays.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.engine = engine
+        self.dtype = np.dtype(dtype)
+        self.m_max = m_max
+        self.out = out
+        self.keep = mo.kept_parameters(out)
+        self.loanbook = loanbook
+        self.erc_lookup = erc_lookup
+        self.products = loanbook['product'].str.strip().str.lower().values
+        self.erc_curves, self.erc_index = mo.curve_lookup(
+            erc_lookup, self.products, m_max, self.dtype)
+        # the per loan inputs are needed by the scenario methods, the workers
+        # have already warned of any ignored adjustments
+        self._loan_inputs(loanbook)
+        self.instrument = None
+        self.run_summary = None
+        self.run_dir = None
+        self.cache = None
+        self.cached_eir = None
+
+        # set every parameter array, None where it was not kept
+        for param in mo.GRIDS:
+            setattr(self, mo.GRIDS[param], grids.get(param))
+
+        self.parameter_mapping = {
+            param: grids[param] for param in mo.PARAMETERS if param in grids
+            }
+
+    def calculate_cashflow(self, cpr):
+        raise RuntimeError("SharedCashflow is already calculated, use "
+                           "'run_parallel' to recalculate.")
+
+
+def run_parallel(loanbook, erc_lookup, cpr, processes=None, chunk_size=10000,
+                 shards_per_process=4, out='all', **kwargs):
+    """
+    Calculates cashflows for a loanbook across a pool of processes. The
+    loanbook is split into shards which are calculated independently, with
+    each worker writing its rows into shared memory result arrays.
+
+    Parameters
+    ----------
+    loanbook : Pandas DataFrame
+        Formatted loanbook data.
+    erc_lookup : Pandas DataFrame
+        Formatted ERC Lookup data.
+    cpr : Pandas DataFrame
+        Formatted CPR Curves data.
+    processes : int, optional
+        Number of worker processes. The default is None (one per core).
+    chunk_size : int, optional
+        Largest number of loans a worker calculates at once.
+        The default is 10000.
+    shards_per_process : int, optional
+        Number of shards per process, more shards balance the work better.
+        The default is 4.
+    out : list, optional
+        List of parameter names to keep for every month, as for Cashflow.
+        The default is 'all'.
+    **kwargs
+        Additional keyword arguments passed to Cashflow, eg 'engine'.
+
+    Returns
+    -------
+    SharedCashflow
+        Calculated cashflow object.
+
+    """
+
+    if processes is None:
+        processes = os.cpu_count()
+    loanbook = loanbook.reset_index(drop=True)
+    loans = len(loanbook)
+    m_max = mo.curve_months(erc_lookup)
+    dtype = np.dtype(kwargs.get('dtype', np.float64))
+
+    # find which parameters are kept for every month
+    keep = mo.kept_parameters(out)
+
+    # allocate a shared memory block for each kept parameter
+    shared, grids, arrays = [], {}, {}
+    for param in keep:
+        param_dtype = np.dtype(np.float64) if param in mo.ACCUMULATORS \
+            else dtype
+        shape = (loans, m_max)
+        shm = SharedMemory(create=True,
+                           size=max(loans * m_max * param_dtype.itemsize, 1))
+        shared.append(shm)
+        grids[param] = _shared_array(shm, shape, param_dtype)
+        arrays[param] = (shm.name, shape, param_dtype.str)
+
+    # split the loanbook into shards of consecutive rows
+    bounds = np.linspace(0, loans, processes * shards_per_process + 1)
+    bounds = np.unique(bounds.astype(int))
+    shards = [(start, stop, chunk_size, arrays)
+              for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    try:
+        with Pool(processes, initializer=_init_worker,
+                  initargs=(loanbook, erc_lookup, cpr,
+                            dict(kwargs, out=out))) as pool:
+            pool.map(_run_shard, shards, chunksize=1)
+    finally:
+        # the blocks can be unlinked now, they stay mapped while the result
+        # arrays exist
+        for shm in shared:
+            shm.unlink()
+
+    return SharedCashflow(loanbook, erc_lookup, m_max, out, grids,
+                          kwargs.get('engine', 'numpy'), dtype)
@@ -0,0 +1,219 @@
+"""
+Render
+
+Developers:
+James Briggs
+
+Description:
+Script used to save per loan visualisations of the calculated arrays for
+large numbers of loans. Figures are drawn with the non-interactive Agg
+canvas, so no window or GUI backend is needed. Each worker process builds
+one figure and updates its line data for every loan rather than drawing a
+new figure each time. Loans are saved as PNGs, or as a multi-page PDF per
+product.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from multiprocessing import Pool
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+import seaborn as sns
+
+# pypdf is only needed to render the pages of one product's PDF in parallel
+try:
+    from pypdf import PdfWriter
+    PYPDF = True
+except ImportError:
+    PYPDF = False
+
+
+def _template(parameters):
+    """
+    Builds the figure reused for every loan, with one subplot and line per
+    parameter, laid out as 'Cashflow.plot'.
+
+    Parameters
+    ----------
+    parameters : list
+        Names of the parameters plotted, used as subplot titles.
+
+    Returns
+    -------
+    fig : matplotlib Figure
+        Figure drawn on an Agg canvas.
+    lines : list
+        Line2D of each parameter.
+    title : matplotlib Text
+        Figure title, updated with each loan's name.
+    """
+    # we do some calculations to find optimal width and height of subplot
+    width = sorted([(len(parameters) % x, x) for x in range(2, 7)])[0][1]
+    height = int(np.ceil(len(parameters) / width))
+
+    with sns.axes_style('white'):
+        fig = Figure(figsize=(5*width, 4*height))
+        FigureCanvasAgg(fig)
+        ax = fig.subplots(nrows=height, ncols=width, squeeze=False)
+
+    lines = []
+    for j, axes in enumerate(ax.flat):
+        if j < len(parameters):
+            lines.append(axes.plot([], [], color='#726EFF', linewidth=2)[0])
+            axes.set_title(parameters[j])
+        else:
+            # hide subplots left over in the final row
+            axes.set_axis_off()
+    title = fig.suptitle('', fontsize=14)
+    return fig, lines, title
+
+
+def _render(task):
+    """
+    Renders a group of loans onto one reused figure.
+
+    Parameters
+    ----------
+    task : tuple
+        Tuple in format (path, format, parameters, names, arrays, file) where
+        arrays has shape (loans, parameters, months), names gives the title
+        and filename of each loan, and file is the PDF filename.
+
+    Returns
+    -------
+    int
+        Number of loans rendered.
+    """
+    path, format, parameters, names, arrays, file = task
+    fig, lines, title = _template(parameters)
+    months = np.arange(arrays.shape[2])
+
+    pdf = PdfPages(os.path.join(path, f"{file}.pdf")) \
+        if format == 'pdf' else None
+    try:
+        for i in range(len(names)):
+            # update the line data and rescale each subplot to it
+            for j, line in enumerate(lines):
+                line.set_data(months, arrays[i, j])
+                line.axes.relim()
+                line.axes.autoscale_view()
+            title.set_text(names[i])
+
+            if pdf is None:
+                fig.savefig(os.path.join(path, f"{names[i]}.png"))
+            else:
+                pdf.savefig(fig)
+    finally:
+        if pdf is not None:
+            pdf.close()
+
+    return len(names)
+
+
+def render_loans(arrays, parameters, names, products, path, format='png',
+                 processes=None, chunk_size=100):
+    """
+    Saves a visualisation of the given arrays for every loan, spread across
+    a pool of processes.
+
+    Parameters
+    ----------
+    arrays : list
+        Arrays of shape (loans, months), one per parameter.
+    parameters : list
+        Names of the parameters, used as subplot titles.
+    names : numpy array
+        Name of each loan, used as the figure title and PNG filename.
+    products : numpy array
+        Product of each loan, loans are grouped into a PDF per product.
+    path : str
+        Directory the visualisations are saved to.
+    format : str, optional
+        Either 'png' for a file per loan, or 'pdf' for a multi-page PDF per
+        product with a page per loan. Where pypdf is installed each product's
+        pages are rendered in chunks across the pool and merged, otherwise
+        each product is rendered by a single process.
+        The default is 'png'.
+    processes : int, optional
+        Number of worker processes, 1 renders in this process.
+        The default is None (one per core).
+    chunk_size : int, optional
+        Number of loans rendered by each task.
+        The default is 100.
+
+    Returns
+    -------
+    int
+        Number of loans rendered.
+    """
+    if format not in ('png', 'pdf'):
+        raise ValueError(f"'{format}' is not a valid format, use either "
+                         "'png' or 'pdf'.")
+
+    # if output directory does not already exist, make it
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    names = np.asarray(names, dtype=str)
+    if format == 'pdf':
+        products = np.asarray(products, dtype=str)
+        groups, files, parts = [], [], {}
+        for product in np.unique(products):
+            rows = np.flatnonzero(products == product)
+            if PYPDF:
+                # split the product into chunks rendered to part files,
+                # which are merged into the product's PDF afterwards
+                chunks = [rows[first:first + chunk_size]
+                          for first in range(0, len(rows), chunk_size)]
+            else:
+                # one task per product, so its pages go in one file
+                chunks = [rows]
+            parts[product] = [f"{product}_{k}" for k in range(len(chunks))]
+            groups += chunks
+            files += parts[product]
+        # part files are written to a scratch directory inside path
+        scratch = tempfile.mkdtemp(dir=path)
+    else:
+        groups = [np.arange(first, min(first + chunk_size, len(names)))
+                  for first in range(0, len(names), chunk_size)]
+        files = [None] * len(groups)
+        scratch = path
+
+    # each task's data is sliced only as the task is handed out, so only the
+    # tasks in flight are copied rather than every loan's arrays at once
+    tasks = ((scratch, format, parameters, names[rows],
+              np.stack([array[rows] for array in arrays], axis=1), file)
+             for rows, file in zip(groups, files))
+
+    try:
+        if processes == 1 or len(groups) <= 1:
+            rendered = sum(map(_render, tasks))
+        else:
+            with Pool(processes) as pool:
+                rendered = sum(pool.imap_unordered(_render, tasks))
+
+        if format == 'pdf':
+            # combine the parts of each product into a single PDF, in order
+            for product in parts:
+                full_path = os.path.join(path, f"{product}.pdf")
+                if len(parts[product]) == 1:
+                    os.replace(os.path.join(scratch,
+                                            f"{parts[product][0]}.pdf"),
+                               full_path)
+                    continue
+                writer = PdfWriter()
+                for part in parts[product]:
+                    writer.append(os.path.join(scratch, f"{part}.pdf"))
+                with open(full_path, 'wb') as fp:
+                    writer.write(fp)
+                writer.close()
+    finally:
+        if format == 'pdf':
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    # update user showing where visualisations have been saved
+    print(f"{rendered} visualisations saved to {path}.")
+    return rendered
@@ -0,0 +1,10 @@
+"""
+Test configuration, the model scripts import each other by name so the code
+directory is put on the path.
+"""
+
+import os
+import sys
+
+CODE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code')
+sys.path.insert(0, os.path.abspath(CODE))
@@ -0,0 +1,57 @@
+"""
+Tests of loanbook reading and snapshots.
+"""
+
+import os
+import pandas as pd
+import pytest
+import data as d
+
+LOANBOOK = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                        'data', 'loanbook.csv')
+
+
+@pytest.mark.parametrize('engine', [
+    'c', pytest.param('pyarrow', marks=pytest.mark.skipif(
+        not d.ARROW, reason="pyarrow is not installed"))])
+@pytest.mark.parametrize('chunksize', [100000, 7])
+def test_read_loanbook_matches_format_loanbook(engine, chunksize):
+    expected = d.format_loanbook(pd.read_csv(LOANBOOK, sep='|'), {},
+                                 verbose=False)
+    loanbook = d.read_loanbook(LOANBOOK, {}, engine=engine,
+                               chunksize=chunksize, verbose=False)
+    pd.testing.assert_frame_equal(loanbook, expected)
+
+
+def test_load_loanbook_keeps_snapshots_of_other_flags(tmp_path):
+    file = tmp_path / 'loanbook.csv'
+    lines = open(LOANBOOK).read().splitlines(keepends=True)
+    file.write_text(''.join(lines))
+    snapshot = str(tmp_path / 'snapshots')
+
+    # one file read with two flag sets gives two snapshots
+    for conv_full_term in (False, True):
+        d.load_loanbook(str(file), {}, conv_full_term=conv_full_term,
+                        snapshot=snapshot, verbose=False)
+    first = set(os.listdir(snapshot))
+    assert len(first) == 2
+
+    # a file of the same name elsewhere does not remove them
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'loanbook.csv').write_text(''.join(lines[:-1]))
+    d.load_loanbook(str(other / 'loanbook.csv'), {}, snapshot=snapshot,
+                    verbose=False)
+    assert first < set(os.listdir(snapshot))
+
+    # changing the file replaces only the snapshot of the flags it is read
+    # with
+    file.write_text(''.join(lines[:-1]))
+    loanbook = d.load_loanbook(str(file), {}, snapshot=snapshot,
+                               verbose=False)
+    after = set(os.listdir(snapshot))
+    assert len(after) == 3 and len(first & after) == 1
+    pd.testing.assert_frame_equal(
+        d.load_loanbook(str(file), {}, snapshot=snapshot, verbose=False),
+        loanbook)
+    assert set(os.listdir(snapshot)) == after
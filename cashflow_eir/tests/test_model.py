@@ -0,0 +1,43 @@
+"""
+Tests of the Cashflow model.
+"""
+
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import pytest
+import data as d
+import model as mo
+
+
+@pytest.fixture(scope='module')
+def book():
+    # generated loanbook, CPR and ERC tables ready for Cashflow
+    loanbook, cpr, erc = d.make_loans(2000, products=4, horizon=60, seed=0)
+    loanbook = d.calc_loanbook(d.format_loanbook(loanbook, {}, verbose=False),
+                               verbose=False)
+    cpr = d.format_array(cpr, {'Product': 'product'})
+    erc = d.format_array(erc, {'Product': 'product'})
+    return loanbook, cpr, erc
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+@pytest.mark.parametrize('batches', [1, 3])
+def test_scenario_batch_size_respects_memory(book, dtype, batches):
+    loanbook, cpr, erc = book
+    cashflow = mo.Cashflow(loanbook, erc, out=['cashflow'], dtype=dtype)
+    per_scenario, valuation = cashflow._scenario_memory()
+    memory = valuation + batches * per_scenario
+    assert cashflow._scenario_batch_size(memory) == batches
+
+    scenarios = [cpr.assign(**{col: cpr[col] * (0.8 + 0.1 * i)
+                               for col in cpr.columns if col != 'product'})
+                 for i in range(4)]
+    tracemalloc.start()
+    try:
+        cashflow.calculate_scenarios(scenarios, datetime(2022, 1, 1),
+                                     datetime(2022, 12, 1), memory=memory)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak <= memory